@@ -17,7 +17,8 @@ from utils.config_loader import get_model_config
 def export_to_coreml(
     pytorch_model_path: str,
     output_dir: str = "ios/KeyboardAI",
-    model_name: str = "KeyboardAI"
+    model_name: str = "KeyboardAI",
+    quantize: bool = True
 ):
     """
     Export PyTorch model to Core ML format.
@@ -26,6 +27,7 @@ def export_to_coreml(
         pytorch_model_path: Path to trained PyTorch model (.pt)
         output_dir: Output directory for Core ML model
         model_name: Name for the Core ML model
+        quantize: Linearly quantize weights to int8 after conversion
     """
     print("="*70)
     print("Exporting to Core ML for iOS")
@@ -94,6 +96,14 @@ def export_to_coreml(
         compute_precision=ct.precision.FLOAT16  # Use FP16 for smaller size
     )
     
+    # Quantize weights to int8 (~4x smaller than FP32, faster on the ANE)
+    if quantize:
+        import coremltools.optimize.coreml as cto
+        
+        op_config = cto.OpLinearQuantizerConfig(mode="linear_symmetric", dtype="int8")
+        mlmodel = cto.linear_quantize_weights(mlmodel, cto.OptimizationConfig(global_config=op_config))
+        print(f"   ✓ Weights quantized to int8")
+    
     # Add metadata
     mlmodel.author = "Minh Phu Pham"
     mlmodel.license = "MIT"
@@ -136,7 +146,8 @@ def export_to_coreml(
         "input_name": "input_ids",
         "output_name": "logits",
         "min_ios_version": "15.0",
-        "compute_precision": "FLOAT16"
+        "compute_precision": "FLOAT16",
+        "quantization": "int8" if quantize else "none"
     }
     
     metadata_path = output_path / "model_info.json"
@@ -174,6 +185,11 @@ if __name__ == "__main__":
         default="KeyboardAI",
         help="Model name"
     )
+    parser.add_argument(
+        "--no-quantize",
+        action="store_true",
+        help="Keep FP16 weights instead of quantizing to int8"
+    )
     
     args = parser.parse_args()
     
@@ -193,4 +209,4 @@ if __name__ == "__main__":
         print("  pip install coremltools")
         exit(1)
     
-    export_to_coreml(args.model, args.output, args.name)
+    export_to_coreml(args.model, args.output, args.name, quantize=not args.no_quantize)
@@ -0,0 +1,117 @@
+"""
+Export the Japanese model to Core ML format for iOS deployment
+"""
+
+import torch
+import coremltools as ct
+import numpy as np
+import json
+import logging
+import shutil
+from pathlib import Path
+import sys
+sys.path.append('src')
+from model.tiny_lstm import TinyLSTM
+
+logger = logging.getLogger(__name__)
+
+# Sequence lengths the Core ML model accepts; the keyboard pads to the
+# smallest one that fits instead of always running 50 LSTM steps
+SEQ_LENGTHS = (4, 8, 16, 32, 50)
+
+
+def _capture(model, example_input):
+    """Capture the model graph with torch.export, falling back to jit.script"""
+    seq_len = torch.export.Dim('seq_len', min=1, max=max(SEQ_LENGTHS))
+    try:
+        return torch.export.export(model, (example_input,), dynamic_shapes={'x': {1: seq_len}})
+    except Exception as e:
+        logger.warning(f'⚠️  torch.export failed ({e}), falling back to jit.script')
+        # Scripting keeps the sequence length dynamic (tracing bakes in 50);
+        # freezing inlines the weights so the LSTM gates can be fused
+        return torch.jit.freeze(torch.jit.script(model))
+
+
+def run(model_dir='models/japanese', output_dir='ios/KeyboardAI/Japanese'):
+    """
+    Convert the trained Japanese checkpoint into KeyboardAI_Japanese.mlpackage.
+
+    Args:
+        model_dir: Directory containing best_model.pt
+        output_dir: Directory for the Core ML package and model_info.json
+    """
+    logger.info('Loading Japanese model...')
+    checkpoint = torch.load(str(Path(model_dir) / 'best_model.pt'), map_location='cpu')
+    model = TinyLSTM(vocab_size=32000, embedding_dim=128, hidden_dim=256)
+    model.load_state_dict(checkpoint['model_state_dict'])
+    model.eval()
+
+    logger.info('Exporting model graph...')
+    example_input = torch.zeros((1, max(SEQ_LENGTHS)), dtype=torch.long)
+    exported_model = _capture(model, example_input)
+
+    logger.info('Converting to Core ML...')
+    mlmodel = ct.convert(
+        exported_model,
+        inputs=[ct.TensorType(
+            shape=ct.EnumeratedShapes(shapes=[(1, n) for n in SEQ_LENGTHS], default=(1, max(SEQ_LENGTHS))),
+            dtype=np.int32,
+            name='input_ids'
+        )],
+        convert_to='mlprogram',
+        compute_precision=ct.precision.FLOAT16
+    )
+
+    # Quantize weights to int8 (half the size of FP16, faster on the ANE)
+    import coremltools.optimize.coreml as cto
+
+    op_config = cto.OpLinearQuantizerConfig(mode='linear_symmetric', dtype='int8', weight_threshold=1024)
+    mlmodel = cto.linear_quantize_weights(mlmodel, cto.OptimizationConfig(global_config=op_config))
+
+    mlmodel.author = 'Minh Phu Pham'
+    mlmodel.short_description = 'Japanese keyboard prediction model'
+    mlmodel.version = '1.0.0'
+
+    # Save
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    package_path = output_dir / 'KeyboardAI_Japanese.mlpackage'
+    mlmodel.save(str(package_path))
+
+    # Precompile so the keyboard extension never compiles the model on launch
+    # (coremlcompiler is only available on macOS)
+    if sys.platform == 'darwin':
+        compiled_path = output_dir / 'KeyboardAI_Japanese.mlmodelc'
+        if compiled_path.exists():
+            shutil.rmtree(compiled_path)
+        ct.utils.compile_model(str(package_path), str(compiled_path))
+        logger.info(f'   Compiled: {compiled_path}')
+
+    # Save metadata
+    metadata = {
+        'language': 'japanese',
+        'vocab_size': 32000,
+        'model_version': '1.0.0',
+        'embedding_dim': 128,
+        'hidden_dim': 256,
+        'sequence_lengths': list(SEQ_LENGTHS),
+        'quantization': 'int8'
+    }
+    with open(output_dir / 'model_info.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    logger.info('✅ Japanese model exported to Core ML')
+    logger.info(f'   Location: {package_path}')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Export the Japanese model to Core ML')
+    parser.add_argument('--model-dir', default='models/japanese',
+                       help='Directory containing best_model.pt')
+    parser.add_argument('--output-dir', default='ios/KeyboardAI/Japanese',
+                       help='Output directory for the Core ML package')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    run(args.model_dir, args.output_dir)
@@ -4,10 +4,120 @@ Comprehensive Japanese Predictive Text Dictionary
 For 100% test pass rate - Production Ready
 """
 
-import json
+import sys
 from typing import List, Dict
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'src'))
+from utils.json_io import load_json, save_json
+
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _intern_test_strings(test: Dict) -> None:
+    """Intern a test's input and expected strings so comparisons hit identity"""
+    if 'input' in test:
+        test['input'] = sys.intern(test['input'])
+    for field in ('expected_suggestions', 'expected_suggestions_default'):
+        if field in test:
+            test[field] = [sys.intern(value) for value in test[field]]
+
+
+class _TrieNode:
+    """Prefix trie node: exact predictions plus precomputed top-10 completions"""
+    
+    __slots__ = ('children', 'top10', 'values')
+    
+    def __init__(self):
+        self.children = {}
+        self.top10 = {}
+        self.values = None
+
+
+def _build_trie(predictions: Dict[str, List[str]]) -> _TrieNode:
+    """
+    Build a prefix trie over the prediction dictionary
+    
+    Each node stores the first 10 distinct completions from keys strictly
+    longer than its prefix (in dictionary order, excluding the prefix itself),
+    so a lookup is a single walk with no scanning.
+    """
+    root = _TrieNode()
+    intern = sys.intern
+    
+    for key, values in predictions.items():
+        values = [intern(value) for value in values]
+        node = root
+        for depth, char in enumerate(key):
+            # Node for key[:depth] gains this key's values as completions;
+            # dict.update keeps first-seen order and dedups in C
+            top10 = node.top10
+            if len(top10) < 10:
+                prefix = key[:depth]
+                top10.update(dict.fromkeys([value for value in values if value != prefix]))
+            node = node.children.setdefault(char, _TrieNode())
+        node.values = tuple(values)
+    
+    # Freeze the ordered completion dicts into tuples
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        node.top10 = tuple(node.top10)[:10]
+        stack.extend(node.children.values())
+    
+    return root
+
+
+def _flatten_trie(root: _TrieNode):
+    """
+    Flatten the trie into CSR-style integer arrays for the compiled walk
+    
+    Returns (nodes, node_first_child, edge_char, edge_target) where the edges
+    of node i are edge_char/edge_target[node_first_child[i]:node_first_child[i + 1]]
+    and edge chars are Unicode codepoints.
+    """
+    nodes = [root]
+    first_child = [0]
+    edge_char = []
+    edge_target = []
+    
+    # BFS numbering: nodes list grows while we iterate it
+    for node in nodes:
+        for char, child in sorted(node.children.items()):
+            edge_char.append(ord(char))
+            edge_target.append(len(nodes))
+            nodes.append(child)
+        first_child.append(len(edge_char))
+    
+    return (
+        nodes,
+        np.array(first_child, dtype=np.int32),
+        np.array(edge_char, dtype=np.uint32),
+        np.array(edge_target, dtype=np.int32),
+    )
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _walk_flat(codes, node_first_child, edge_char, edge_target):
+        """Follow codepoints from the root; returns the node index or -1"""
+        node = 0
+        for code in codes:
+            next_node = -1
+            for edge in range(node_first_child[node], node_first_child[node + 1]):
+                if edge_char[edge] == code:
+                    next_node = edge_target[edge]
+                    break
+            if next_node < 0:
+                return -1
+            node = next_node
+        return node
+
+
 class JapanesePredictiveTextDictionary:
     """
     Complete predictive text dictionary for Japanese keyboard
@@ -88,24 +198,33 @@ class JapanesePredictiveTextDictionary:
     
     def get_predictions(self, hiragana_input: str) -> List[str]:
         """Get predictions for hiragana input"""
-        # Direct lookup
-        if hiragana_input in self.PREDICTIONS:
-            return self.PREDICTIONS[hiragana_input]
-        
-        # Prefix matching for partial inputs
-        predictions = []
-        for key, values in self.PREDICTIONS.items():
-            if key.startswith(hiragana_input) and len(key) > len(hiragana_input):
-                # Add completions
-                for value in values:
-                    if value not in predictions and value != hiragana_input:
-                        predictions.append(value)
+        if _FLAT is not None:
+            nodes, first_child, edge_char, edge_target = _FLAT
+            codes = np.frombuffer(hiragana_input.encode('utf-32-le'), dtype=np.uint32)
+            index = _walk_flat(codes, first_child, edge_char, edge_target)
+            if index < 0:
+                return [hiragana_input]
+            node = nodes[index]
+        else:
+            node = _TRIE
+            for char in hiragana_input:
+                node = node.children.get(char)
+                if node is None:
+                    return [hiragana_input]
         
-        # If no predictions, return input itself
-        if not predictions:
-            predictions = [hiragana_input]
+        # Direct lookup
+        if node.values is not None:
+            return list(node.values)
         
-        return predictions[:10]  # Top 10
+        # Prefix matching for partial inputs (precomputed at import)
+        return list(node.top10) or [hiragana_input]
+
+
+# Built once at import so every dictionary instance shares it
+_TRIE = _build_trie(JapanesePredictiveTextDictionary.PREDICTIONS)
+
+# Integer-array form of the trie for the Numba walk (when numba is installed)
+_FLAT = _flatten_trie(_TRIE) if njit is not None else None
 
 
 class PredictiveTextTester:
@@ -117,9 +236,11 @@ class PredictiveTextTester:
         
     def load_test_cases(self):
         """Load test cases"""
-        with open('test-data/test-kanji-cases.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            self.test_cases = data['test_cases']
+        data = load_json('test-data/test-kanji-cases.json')
+        for category in data['test_cases']:
+            for test in category['tests']:
+                _intern_test_strings(test)
+        self.test_cases = data['test_cases']
     
     def test_category(self, category: Dict):
         """Test a category"""
@@ -142,7 +263,7 @@ class PredictiveTextTester:
             predictions = self.dictionary.get_predictions(input_text)
             
             # Check if ANY expected suggestion is in predictions
-            found = any(exp in predictions for exp in expected)
+            found = not set(predictions).isdisjoint(expected)
             
             status = "✅" if found else "❌"
             print(f"\n{status} Input: '{input_text}'")
@@ -259,8 +380,7 @@ class PredictiveTextTester:
             'failed_tests': all_failed
         }
         
-        with open(results_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        save_json(results, results_file)
         
         print(f"\n📊 Results saved to: {results_file}")
         print("="*70)
@@ -272,7 +392,6 @@ def main():
     tester = PredictiveTextTester()
     success = tester.run_all_tests()
     
-    import sys
     sys.exit(0 if success else 1)
 
 
@@ -13,7 +13,6 @@ sys.path.insert(0, str(Path.cwd()))
 
 from src.tokenizer.train_tokenizer import TokenizerTrainer
 from src.model.tiny_lstm import TinyLSTM
-import subprocess
 
 def main():
     print("="*70)
@@ -43,17 +42,17 @@ def main():
     
     # Step 2: Train model
     print("Step 2: Training model...")
-    print("Running: python src/model/train.py")
     print()
     
-    result = subprocess.run([
-        sys.executable, 'src/model/train.py',
-        '--data-file', 'data/processed/comprehensive_train.txt',
-        '--epochs', '30'
-    ])
-    
-    if result.returncode != 0:
-        print("❌ Training failed")
+    # Run in-process so torch is imported once for the whole pipeline
+    from src.model import train as train_mod
+    try:
+        train_mod.main(
+            data_file='data/processed/comprehensive_train.txt',
+            num_epochs=30
+        )
+    except Exception as e:
+        print(f"❌ Training failed: {e}")
         sys.exit(1)
     
     # Copy to Japanese directory
@@ -65,12 +64,11 @@ def main():
     
     # Step 3: Export to Core ML
     print("Step 3: Exporting to Core ML...")
-    result = subprocess.run([
-        sys.executable, 'scripts/export_coreml.py'
-    ])
-    
-    if result.returncode != 0:
-        print("❌ Export failed")
+    try:
+        from scripts.export_coreml import export_to_coreml
+        export_to_coreml('models/best_model.pt', 'ios/KeyboardAI', 'KeyboardAI')
+    except Exception as e:
+        print(f"❌ Export failed: {e}")
         sys.exit(1)
     
     # Move to Japanese directory
@@ -86,7 +84,8 @@ def main():
         'vocab_size': 32000,
         'model_version': '1.0.0',
         'embedding_dim': 128,
-        'hidden_dim': 256
+        'hidden_dim': 256,
+        'quantization': 'int8'
     }
     with open('ios/KeyboardAI/Japanese/model_info.json', 'w') as f:
         json.dump(model_info, f, indent=2)
@@ -4,11 +4,38 @@ Multi-language training script.
 Trains separate models for Japanese and English for better predictions.
 """
 
+import logging
+import os
+import shutil
 import yaml
-import subprocess
-import sys
 from pathlib import Path
 
+try:
+    from yaml import CSafeDumper as _Dumper
+except ImportError:
+    from yaml import SafeDumper as _Dumper
+
+logger = logging.getLogger(__name__)
+
+
+def _log_lines(*lines):
+    """Emit a block of output lines as a single log record"""
+    logger.info("\n".join(lines))
+
+
+def _link_or_copy(src, dst):
+    """Hardlink src to dst, falling back to a plain copy (e.g. across filesystems)"""
+    dst = Path(dst)
+    if dst.is_dir():
+        dst = dst / Path(src).name
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
 class MultiLanguageTrainer:
     """Train separate models for each language"""
     
@@ -19,18 +46,22 @@ class MultiLanguageTrainer:
         
     def train_japanese_model(self):
         """Train Japanese-specific model"""
-        print("="*70)
-        print("TRAINING JAPANESE MODEL")
-        print("="*70)
-        print()
+        _log_lines(
+            "="*70,
+            "TRAINING JAPANESE MODEL",
+            "="*70,
+            "",
+        )
         
         # Use existing comprehensive Japanese data
         data_file = 'data/processed/comprehensive_train.txt'
         
-        print(f"📊 Data: {data_file}")
-        print(f"🎯 Language: Japanese")
-        print(f"📦 Output: models/japanese/")
-        print()
+        _log_lines(
+            f"📊 Data: {data_file}",
+            f"🎯 Language: Japanese",
+            f"📦 Output: models/japanese/",
+            "",
+        )
         
         # Create Japanese model directory
         (self.models_dir / 'japanese').mkdir(parents=True, exist_ok=True)
@@ -64,7 +95,8 @@ class MultiLanguageTrainer:
                 'validation_split': 0.05,
                 'gradient_clip': 1.0,
                 'save_dir': 'models/japanese',
-                'log_interval': 1000
+                'log_interval': 1000,
+                'compile': True
             },
             'optimization': {
                 'target_model_size_mb': 25
@@ -73,13 +105,15 @@ class MultiLanguageTrainer:
         
         # Save config
         with open('config/model_config_japanese.yaml', 'w') as f:
-            yaml.dump(config, f, default_flow_style=False)
+            yaml.dump(config, f, Dumper=_Dumper, default_flow_style=False)
         
-        print("✅ Configuration saved: config/model_config_japanese.yaml")
-        print()
+        _log_lines(
+            "✅ Configuration saved: config/model_config_japanese.yaml",
+            "",
+        )
         
         # Train tokenizer
-        print("🔧 Training Japanese tokenizer...")
+        logger.info("🔧 Training Japanese tokenizer...")
         from src.tokenizer.train_tokenizer import TokenizerTrainer
         trainer = TokenizerTrainer()
         trainer.train(
@@ -90,133 +124,86 @@ class MultiLanguageTrainer:
         )
         
         # Move tokenizer files to Japanese directory
-        import shutil
-        shutil.copy('models/tokenizer.model', 'models/japanese/tokenizer.model')
-        shutil.copy('models/tokenizer.vocab', 'models/japanese/tokenizer.vocab')
-        print('✅ Japanese tokenizer trained')
-        
-        print()
+        _link_or_copy('models/tokenizer.model', 'models/japanese/tokenizer.model')
+        _link_or_copy('models/tokenizer.vocab', 'models/japanese/tokenizer.vocab')
+        _log_lines('✅ Japanese tokenizer trained', "")
         
         # Train model
-        print("🚀 Training Japanese model...")
-        print("   This will take 2-4 hours...")
-        print()
+        _log_lines(
+            "🚀 Training Japanese model...",
+            "   This will take 2-4 hours...",
+            "",
+        )
         
         # Copy config to main location temporarily
-        subprocess.run(['cp', 'config/model_config_japanese.yaml', 'config/model_config.yaml'], check=True)
+        shutil.copyfile('config/model_config_japanese.yaml', 'config/model_config.yaml')
         
-        # Train
-        subprocess.run([
-            sys.executable, 'src/model/train.py',
-            '--data-file', data_file,
-            '--epochs', '30'
-        ], check=True)
+        # Train in-process so torch is imported once for the whole pipeline
+        from src.model.train import main as train_main
+        train_main(data_file=data_file, num_epochs=30)
         
         # Move trained model to Japanese directory
-        subprocess.run(['cp', 'models/best_model.pt', 'models/japanese/best_model.pt'], check=True)
-        subprocess.run(['cp', 'models/training_history.json', 'models/japanese/training_history.json'], check=True)
-        
-        print()
-        print("✅ Japanese model trained!")
-        print(f"   Model: models/japanese/best_model.pt")
-        print(f"   Tokenizer: models/japanese/tokenizer.model")
-        print()
+        os.replace('models/best_model.pt', 'models/japanese/best_model.pt')
+        os.replace('models/training_history.json', 'models/japanese/training_history.json')
+        
+        _log_lines(
+            "",
+            "✅ Japanese model trained!",
+            f"   Model: models/japanese/best_model.pt",
+            f"   Tokenizer: models/japanese/tokenizer.model",
+            "",
+        )
         
     def train_english_model(self):
         """Train English-specific model (placeholder for future)"""
-        print("="*70)
-        print("TRAINING ENGLISH MODEL")
-        print("="*70)
-        print()
-        
-        print("⚠️  English training data not available yet")
-        print("   Skipping English model training")
-        print()
-        print("📝 To train English model:")
-        print("   1. Add English data to data/english/")
-        print("   2. Run: python scripts/train_multilang.py --language english")
-        print()
+        _log_lines(
+            "="*70,
+            "TRAINING ENGLISH MODEL",
+            "="*70,
+            "",
+        )
+        
+        _log_lines(
+            "⚠️  English training data not available yet",
+            "   Skipping English model training",
+            "",
+            "📝 To train English model:",
+            "   1. Add English data to data/english/",
+            "   2. Run: python scripts/train_multilang.py --language english",
+            "",
+        )
         
     def export_japanese_to_coreml(self):
         """Export Japanese model to Core ML"""
-        print("="*70)
-        print("EXPORTING JAPANESE MODEL TO CORE ML")
-        print("="*70)
-        print()
-        
-        # Create export script for Japanese
-        export_script = """
-import torch
-import coremltools as ct
-import numpy as np
-import json
-from pathlib import Path
-import sys
-sys.path.append('src')
-from model.tiny_lstm import TinyLSTM
-
-print('Loading Japanese model...')
-checkpoint = torch.load('models/japanese/best_model.pt', map_location='cpu')
-model = TinyLSTM(vocab_size=32000, embedding_dim=128, hidden_dim=256)
-model.load_state_dict(checkpoint['model_state_dict'])
-model.eval()
-
-print('Tracing model...')
-example_input = torch.zeros((1, 50), dtype=torch.long)
-traced_model = torch.jit.trace(model, example_input)
-
-print('Converting to Core ML...')
-mlmodel = ct.convert(
-    traced_model,
-    inputs=[ct.TensorType(shape=(1, 50), dtype=np.int32, name='input_ids')],
-    convert_to='mlprogram',
-    compute_precision=ct.precision.FLOAT16
-)
-
-mlmodel.author = 'Minh Phu Pham'
-mlmodel.short_description = 'Japanese keyboard prediction model'
-mlmodel.version = '1.0.0'
-
-# Save
-output_dir = Path('ios/KeyboardAI/Japanese')
-output_dir.mkdir(parents=True, exist_ok=True)
-mlmodel.save(str(output_dir / 'KeyboardAI_Japanese.mlpackage'))
-
-# Save metadata
-metadata = {
-    'language': 'japanese',
-    'vocab_size': 32000,
-    'model_version': '1.0.0',
-    'embedding_dim': 128,
-    'hidden_dim': 256
-}
-with open(output_dir / 'model_info.json', 'w') as f:
-    json.dump(metadata, f, indent=2)
-
-print('✅ Japanese model exported to Core ML')
-print(f'   Location: ios/KeyboardAI/Japanese/KeyboardAI_Japanese.mlpackage')
-"""
-        
-        with open('scripts/export_japanese.py', 'w') as f:
-            f.write(export_script)
+        _log_lines(
+            "="*70,
+            "EXPORTING JAPANESE MODEL TO CORE ML",
+            "="*70,
+            "",
+        )
         
-        # Run export
-        subprocess.run([sys.executable, 'scripts/export_japanese.py'], check=True)
+        # Run in-process so torch/coremltools are imported once for the whole pipeline
+        from scripts.export_japanese import run as run_export
+        run_export('models/japanese', 'ios/KeyboardAI/Japanese')
         
         # Copy tokenizer files
-        subprocess.run(['cp', 'models/japanese/tokenizer.model', 'ios/KeyboardAI/Japanese/'], check=True)
-        subprocess.run(['cp', 'models/japanese/tokenizer.vocab', 'ios/KeyboardAI/Japanese/'], check=True)
+        _link_or_copy('models/japanese/tokenizer.model', 'ios/KeyboardAI/Japanese/')
+        _link_or_copy('models/japanese/tokenizer.vocab', 'ios/KeyboardAI/Japanese/')
         
-        print()
-        print("✅ All Japanese files ready for iOS!")
-        print()
+        _log_lines(
+            "",
+            "✅ All Japanese files ready for iOS!",
+            "",
+        )
         
     def create_language_switcher_ios(self):
         """Create iOS code for language switching"""
-        print("="*70)
-        print("CREATING iOS LANGUAGE SWITCHER")
-        print("="*70)
-        print()
+        _log_lines(
+            "="*70,
+            "CREATING iOS LANGUAGE SWITCHER",
+            "="*70,
+            "",
+        )
         
         ios_code = '''// MultiLanguageKeyboard.swift
 // Language-aware keyboard with model switching
@@ -242,6 +229,14 @@ class MultiLanguageKeyboard {
     // Current language
     private var currentLanguage: KeyboardLanguage = .japanese
     
+    // Input lengths the Core ML model was exported with (ascending)
+    private let sequenceLengths = [4, 8, 16, 32, 50]
+    
+    // LRU cache of recent predictions, keyed by language, topK and context
+    private var predictionCache = [String: [String]]()
+    private var cacheOrder = [String]()
+    private let maxCacheEntries = 64
+    
     init() {
         loadModels()
     }
@@ -249,7 +244,14 @@ class MultiLanguageKeyboard {
     private func loadModels() {
         // Load Japanese model
         do {
-            japaneseModel = try KeyboardAI_Japanese(configuration: MLModelConfiguration())
+            // Load the precompiled .mlmodelc shipped in the bundle so nothing
+            // is compiled on device at extension launch
+            let config = MLModelConfiguration()
+            config.computeUnits = .cpuAndNeuralEngine
+            guard let modelURL = Bundle.main.url(forResource: "KeyboardAI_Japanese", withExtension: "mlmodelc") else {
+                throw CocoaError(.fileNoSuchFile)
+            }
+            japaneseModel = try KeyboardAI_Japanese(contentsOf: modelURL, configuration: config)
             japaneseTokenizer = Tokenizer(vocabFile: "Japanese/tokenizer.vocab")
             print("✅ Japanese model loaded")
         } catch {
@@ -264,19 +266,33 @@ class MultiLanguageKeyboard {
     /// Switch language mode
     func setLanguage(_ language: KeyboardLanguage) {
         currentLanguage = language
+        predictionCache.removeAll()
+        cacheOrder.removeAll()
         print("🌐 Switched to \\(language.rawValue)")
     }
     
     /// Auto-detect language from input text
     func detectLanguage(from text: String) -> KeyboardLanguage {
-        // Simple heuristic: check for Japanese characters
-        let hasJapanese = text.unicodeScalars.contains { scalar in
-            (0x3040...0x309F).contains(scalar.value) ||  // Hiragana
-            (0x30A0...0x30FF).contains(scalar.value) ||  // Katakana
-            (0x4E00...0x9FAF).contains(scalar.value)     // Kanji
+        // Simple heuristic: check for Japanese characters. Every target scalar
+        // is a 3-byte UTF-8 sequence with lead byte 0xE3...0xE9, so Latin text
+        // is rejected byte by byte without decoding scalars
+        var bytes = text.utf8.makeIterator()
+        while let lead = bytes.next() {
+            guard lead >= 0xE3 && lead <= 0xE9,
+                  let b1 = bytes.next(), let b2 = bytes.next() else { continue }
+            let value = (UInt32(lead & 0x0F) << 12) | (UInt32(b1 & 0x3F) << 6) | UInt32(b2 & 0x3F)
+            if isJapanese(value) {
+                return .japanese
+            }
         }
         
-        return hasJapanese ? .japanese : .english
+        return .english
+    }
+    
+    /// Hiragana/Katakana (U+3040–U+30FF) or Kanji (U+4E00–U+9FAF)
+    private func isJapanese(_ value: UInt32) -> Bool {
+        // One unsigned compare covers U+3040..<U+9FB0, then exclude the gap
+        return value &- 0x3040 < 0x9FB0 - 0x3040 && !(value >= 0x3100 && value < 0x4E00)
     }
     
     /// Get predictions using appropriate model
@@ -284,12 +300,35 @@ class MultiLanguageKeyboard {
         // Use specified language or auto-detect
         let targetLanguage = language ?? detectLanguage(from: text)
         
+        // textDidChange often fires with unchanged context (cursor moves, re-renders)
+        let key = "\\(targetLanguage.rawValue)|\\(topK)|\\(text.suffix(50))"
+        if let cached = predictionCache[key] {
+            touchCacheKey(key)
+            return cached
+        }
+        
+        let predictions: [String]
         switch targetLanguage {
         case .japanese:
-            return predictJapanese(text: text, topK: topK)
+            predictions = predictJapanese(text: text, topK: topK)
         case .english:
-            return predictEnglish(text: text, topK: topK)
+            predictions = predictEnglish(text: text, topK: topK)
+        }
+        
+        predictionCache[key] = predictions
+        touchCacheKey(key)
+        if cacheOrder.count > maxCacheEntries {
+            predictionCache.removeValue(forKey: cacheOrder.removeFirst())
+        }
+        return predictions
+    }
+    
+    /// Mark a cache key as most recently used
+    private func touchCacheKey(_ key: String) {
+        if let index = cacheOrder.firstIndex(of: key) {
+            cacheOrder.remove(at: index)
         }
+        cacheOrder.append(key)
     }
     
     private func predictJapanese(text: String, topK: Int) -> [String] {
@@ -302,18 +341,21 @@ class MultiLanguageKeyboard {
         let tokenIds = tokenizer.encode(text)
         guard !tokenIds.isEmpty else { return [] }
         
-        // Prepare input
-        var paddedInput = Array(tokenIds.suffix(50))
-        while paddedInput.count < 50 {
-            paddedInput.insert(0, at: 0)
-        }
+        // Prepare input, padded to the smallest enumerated shape that fits
+        let seqLength = sequenceLengths.first { $0 >= tokenIds.count } ?? sequenceLengths.last!
+        let recentIds = tokenIds.suffix(seqLength).map { Int32($0) }
+        let paddedInput = [Int32](repeating: 0, count: seqLength - recentIds.count) + recentIds
         
-        guard let inputArray = try? MLMultiArray(shape: [1, 50], dataType: .int32) else {
+        guard let inputArray = try? MLMultiArray(shape: [1, NSNumber(value: seqLength)], dataType: .int32) else {
             return []
         }
         
-        for (i, tokenId) in paddedInput.enumerated() {
-            inputArray[i] = NSNumber(value: tokenId)
+        // Single copy into the Int32 buffer instead of one NSNumber per token
+        paddedInput.withUnsafeBufferPointer { src in
+            inputArray.dataPointer.copyMemory(
+                from: src.baseAddress!,
+                byteCount: seqLength * MemoryLayout<Int32>.stride
+            )
         }
         
         // Run model
@@ -324,17 +366,9 @@ class MultiLanguageKeyboard {
         // Get predictions
         let logits = output.logits
         let vocabSize = 32000
-        let lastTokenStart = 49 * vocabSize
-        
-        var scores: [(index: Int, score: Float)] = []
-        for i in 0..<vocabSize {
-            let score = logits[lastTokenStart + i].floatValue
-            scores.append((index: i, score: score))
-        }
+        let lastTokenStart = (seqLength - 1) * vocabSize
         
-        let topTokenIds = scores.sorted { $0.score > $1.score }
-            .prefix(topK * 3)
-            .map { $0.index }
+        let topTokenIds = topIndices(in: logits, offset: lastTokenStart, count: vocabSize, k: topK * 3)
         
         // Decode predictions
         var predictions: [String] = []
@@ -356,6 +390,33 @@ class MultiLanguageKeyboard {
         return predictions
     }
     
+    /// Indices of the k highest scores in logits[offset..<offset+count], best first
+    private func topIndices(in logits: MLMultiArray, offset: Int, count: Int, k: Int) -> [Int] {
+        // Read the Float32 output buffer directly instead of boxing 32K NSNumbers
+        let scores = UnsafeBufferPointer(
+            start: logits.dataPointer.assumingMemoryBound(to: Float.self) + offset,
+            count: count
+        )
+        
+        // Bounded buffer sorted by descending score; anything at or below the
+        // current k-th best is rejected with a single comparison
+        var top: [(index: Int, score: Float)] = []
+        top.reserveCapacity(k + 1)
+        for i in 0..<count {
+            let score = scores[i]
+            if top.count == k && score <= top[k - 1].score {
+                continue
+            }
+            let position = top.firstIndex { score > $0.score } ?? top.count
+            top.insert((index: i, score: score), at: position)
+            if top.count > k {
+                top.removeLast()
+            }
+        }
+        
+        return top.map { $0.index }
+    }
+    
     private func predictEnglish(text: String, topK: Int) -> [String] {
         // Placeholder for English model
         // Will be implemented when English data is available
@@ -399,21 +460,25 @@ class KeyboardViewController: UIInputViewController {
         with open(ios_dir / 'MultiLanguageKeyboard.swift', 'w') as f:
             f.write(ios_code)
         
-        print("✅ iOS language switcher created")
-        print(f"   Location: ios/KeyboardAI/Swift/MultiLanguageKeyboard.swift")
-        print()
+        _log_lines(
+            "✅ iOS language switcher created",
+            f"   Location: ios/KeyboardAI/Swift/MultiLanguageKeyboard.swift",
+            "",
+        )
         
     def run(self, language='japanese'):
         """Run training for specified language"""
-        print("\n" + "="*70)
-        print("MULTI-LANGUAGE MODEL TRAINING")
-        print("="*70)
-        print()
-        print("🎯 Strategy: Separate models for better predictions")
-        print("   - Japanese model: 32K vocab, optimized for Japanese")
-        print("   - English model: 16K vocab, optimized for English")
-        print("   - Language switching: Auto-detect or manual")
-        print()
+        _log_lines(
+            "\n" + "="*70,
+            "MULTI-LANGUAGE MODEL TRAINING",
+            "="*70,
+            "",
+            "🎯 Strategy: Separate models for better predictions",
+            "   - Japanese model: 32K vocab, optimized for Japanese",
+            "   - English model: 16K vocab, optimized for English",
+            "   - Language switching: Auto-detect or manual",
+            "",
+        )
         
         if language == 'japanese' or language == 'all':
             self.train_japanese_model()
@@ -425,21 +490,24 @@ class KeyboardViewController: UIInputViewController {
         # Create iOS switcher
         self.create_language_switcher_ios()
         
-        print("="*70)
-        print("✅ MULTI-LANGUAGE SETUP COMPLETE!")
-        print("="*70)
-        print()
-        print("📁 Files created:")
-        print("   models/japanese/best_model.pt")
-        print("   models/japanese/tokenizer.{model,vocab}")
-        print("   ios/KeyboardAI/Japanese/KeyboardAI_Japanese.mlpackage")
-        print("   ios/KeyboardAI/Swift/MultiLanguageKeyboard.swift")
-        print()
-        print("📱 iOS Integration:")
-        print("   1. Add Japanese model to Xcode")
-        print("   2. Use MultiLanguageKeyboard.swift")
-        print("   3. Auto language detection works!")
-        print()
+        _log_lines(
+            "="*70,
+            "✅ MULTI-LANGUAGE SETUP COMPLETE!",
+            "="*70,
+            "",
+            "📁 Files created:",
+            "   models/japanese/best_model.pt",
+            "   models/japanese/tokenizer.{model,vocab}",
+            "   ios/KeyboardAI/Japanese/KeyboardAI_Japanese.mlpackage",
+            "   ios/KeyboardAI/Japanese/KeyboardAI_Japanese.mlmodelc (macOS only)",
+            "   ios/KeyboardAI/Swift/MultiLanguageKeyboard.swift",
+            "",
+            "📱 iOS Integration:",
+            "   1. Add KeyboardAI_Japanese.mlmodelc to the keyboard extension target",
+            "   2. Use MultiLanguageKeyboard.swift",
+            "   3. Auto language detection works!",
+            "",
+        )
 
 
 def main():
@@ -450,6 +518,7 @@ def main():
                        help='Language to train (default: japanese)')
     args = parser.parse_args()
     
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     trainer = MultiLanguageTrainer()
     trainer.run(language=args.language)
 
@@ -2,44 +2,281 @@
 Dataset statistics and validation
 """
 
+import hashlib
 import json
+import mmap
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from collections import Counter
 from typing import Dict, List
 
+import numpy as np
 
-def analyze_dataset(file_path: Path, language: str = 'en') -> Dict:
-    """Analyze training dataset statistics"""
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Read the corpus in blocks of roughly this many bytes
+_BLOCK_SIZE_HINT = 1 << 20
+
+
+def _iter_text_blocks(file_path: Path):
+    """
+    Yield decoded blocks of whole lines from a memory-mapped file.
     
-    if not file_path.exists():
-        print(f"Error: File not found: {file_path}")
+    Pages are mapped read-only and decoded one ~1 MB block at a time, so
+    memory stays flat regardless of file size. Line endings are normalized
+    the same way text-mode reading does.
+    """
+    if file_path.stat().st_size == 0:
+        return
+    
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        start = 0
+        while start < size:
+            end = mm.find(b'\n', min(start + _BLOCK_SIZE_HINT, size))
+            end = size if end < 0 else end + 1
+            
+            text = mm[start:end].decode('utf-8')
+            if '\r' in text:
+                text = text.replace('\r\n', '\n').replace('\r', '\n')
+            yield text
+            
+            start = end
+
+
+def _is_space(code: int) -> bool:
+    """Codepoint equivalent of str.isspace()"""
+    return (
+        code == 32 or 9 <= code <= 13 or 28 <= code <= 31
+        or code == 133 or code == 160 or code == 5760
+        or 8192 <= code <= 8202 or code == 8232 or code == 8233
+        or code == 8239 or code == 8287 or code == 12288
+    )
+
+
+def _scan_block(codes, keep):
+    """
+    Scan a block of newline-separated codepoints in one pass.
+    
+    Lines are stripped and empty ones skipped, as in the Python path.
+    Marks every codepoint inside a stripped line in `keep`.
+    
+    Returns:
+        (sentences, chars, words, emoji, min_words, max_words); min_words
+        is -1 when the block has no non-empty lines
+    """
+    sentences = 0
+    chars = 0
+    words = 0
+    emoji = 0
+    min_words = -1
+    max_words = 0
+    
+    n = codes.size
+    start = 0
+    while start < n:
+        end = start
+        while end < n and codes[end] != 10:
+            end += 1
+        
+        # Strip leading/trailing whitespace
+        lo = start
+        hi = end
+        while lo < hi and _is_space(codes[lo]):
+            lo += 1
+        while hi > lo and _is_space(codes[hi - 1]):
+            hi -= 1
+        
+        if hi > lo:
+            line_words = 0
+            in_word = False
+            for i in range(lo, hi):
+                code = codes[i]
+                keep[i] = True
+                if _is_space(code):
+                    in_word = False
+                else:
+                    if not in_word:
+                        line_words += 1
+                        in_word = True
+                    if code > 0x1F300:
+                        emoji += 1
+            
+            sentences += 1
+            chars += hi - lo
+            words += line_words
+            if min_words < 0 or line_words < min_words:
+                min_words = line_words
+            if line_words > max_words:
+                max_words = line_words
+        
+        start = end + 1
+    
+    return sentences, chars, words, emoji, min_words, max_words
+
+
+if njit is not None:
+    _is_space = njit(cache=True)(_is_space)
+    _scan_block = njit(cache=True)(_scan_block)
+
+
+def _scan_block_python(lines: List[str]):
+    """Pure-Python fallback for _scan_block; returns the same tuple plus kept codepoints"""
+    sentences = 0
+    chars = 0
+    words = 0
+    min_words = -1
+    max_words = 0
+    kept = []
+    
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        
+        line_words = len(line.split())
+        sentences += 1
+        chars += len(line)
+        words += line_words
+        min_words = line_words if min_words < 0 else min(min_words, line_words)
+        max_words = max(max_words, line_words)
+        kept.append(line)
+    
+    codes = np.frombuffer(''.join(kept).encode('utf-32-le'), dtype=np.uint32)
+    emoji = int((codes > 0x1F300).sum())
+    
+    return sentences, chars, words, emoji, min_words, max_words, codes
+
+
+def _leading_zeros64(values: np.ndarray) -> np.ndarray:
+    """Count leading zero bits of each uint64 (63 for zero)"""
+    values = values.copy()
+    zeros = np.zeros(values.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        small = values < (np.uint64(1) << np.uint64(64 - shift))
+        zeros[small] += shift
+        values[small] <<= np.uint64(shift)
+    return zeros
+
+
+class _HyperLogLog:
+    """
+    HyperLogLog cardinality sketch over Python string hashes.
+    
+    With p=14 it keeps 16K one-byte registers (~0.8% standard error)
+    instead of one set entry per distinct word. str hashes are salted per
+    process, so a sketch must be filled within a single process.
+    """
+    
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+    
+    def update(self, items: List[str]):
+        """Add a batch of strings to the sketch"""
+        if not items:
+            return
+        
+        hashes = np.fromiter(map(hash, items), dtype=np.int64, count=len(items)).view(np.uint64)
+        index = hashes >> np.uint64(64 - self.p)
+        # Rank of the first set bit in the remaining 64 - p bits
+        rank = np.minimum(_leading_zeros64(hashes << np.uint64(self.p)) + 1, 64 - self.p + 1)
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+    
+    def count(self) -> int:
+        """Estimated number of distinct strings added"""
+        m = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        
+        # Small-range correction (linear counting)
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            estimate = m * np.log(m / empty)
+        
+        return int(round(estimate))
+
+
+def file_fingerprint(file_path: Path) -> Dict:
+    """Cheap change detector: mtime, size and SHA-1 of the first 1 MB"""
+    stat = file_path.stat()
+    with open(file_path, 'rb') as f:
+        head_sha1 = hashlib.sha1(f.read(1 << 20)).hexdigest()
+    
+    return {
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'head_sha1': head_sha1
+    }
+
+
+def load_cached_stats(stats_file: str) -> Dict[str, Dict]:
+    """Load previously saved statistics keyed by file path"""
+    try:
+        with open(stats_file, 'r', encoding='utf-8') as f:
+            return {stats['file']: stats for stats in json.load(f)}
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
         return {}
+
+
+def analyze_dataset(file_path: Path, language: str = 'en', exact: bool = False) -> Dict:
+    """
+    Analyze training dataset statistics.
     
-    with open(file_path, 'r', encoding='utf-8') as f:
-        lines = [line.strip() for line in f if line.strip()]
+    Args:
+        file_path: Path to the dataset text file
+        language: Language label stored with the statistics
+        exact: Count unique words with a set instead of a HyperLogLog estimate
+    """
     
-    if not lines:
-        print(f"Warning: No data in {file_path}")
+    if not file_path.exists():
+        print(f"Error: File not found: {file_path}")
         return {}
     
-    # Basic stats
-    total_sentences = len(lines)
-    total_words = sum(len(line.split()) for line in lines)
-    total_chars = sum(len(line) for line in lines)
+    # Taken before scanning so a concurrent edit invalidates the cache
+    fingerprint = file_fingerprint(file_path)
     
-    # Word length distribution
-    word_lengths = [len(line.split()) for line in lines]
+    total_sentences = 0
+    total_words = 0
+    total_chars = 0
+    min_words = None
+    max_words = 0
+    vocabulary = set() if exact else _HyperLogLog()
+    # Presence flag per Unicode codepoint; only the distinct count is reported
+    char_seen = np.zeros(0x110000, dtype=np.bool_)
+    emoji_count = 0
     
-    # Character frequency
-    all_text = ''.join(lines)
-    char_freq = Counter(all_text)
+    # Single streaming pass over ~1 MB memory-mapped blocks
+    for text in _iter_text_blocks(file_path):
+        # Whitespace split across the block yields the same words as per line
+        vocabulary.update(text.split())
+        
+        if njit is not None:
+            codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+            keep = np.zeros(codes.size, dtype=np.bool_)
+            sentences, chars, words, emoji, block_min, block_max = _scan_block(codes, keep)
+            kept = codes[keep]
+        else:
+            sentences, chars, words, emoji, block_min, block_max, kept = _scan_block_python(text.split('\n'))
+        
+        if not sentences:
+            continue
+        
+        total_sentences += sentences
+        total_words += words
+        total_chars += chars
+        emoji_count += emoji
+        min_words = block_min if min_words is None else min(min_words, block_min)
+        max_words = max(max_words, block_max)
+        char_seen[kept] = True
     
-    # Emoji count (Unicode > 0x1F300)
-    emoji_count = sum(1 for c in all_text if ord(c) > 0x1F300)
+    if not total_sentences:
+        print(f"Warning: No data in {file_path}")
+        return {}
     
-    # Unique words
-    all_words = ' '.join(lines).split()
-    unique_words = len(set(all_words))
+    unique_words = len(vocabulary) if exact else vocabulary.count()
     
     stats = {
         'file': str(file_path),
@@ -48,13 +285,15 @@ def analyze_dataset(file_path: Path, language: str = 'en') -> Dict:
         'total_words': total_words,
         'total_characters': total_chars,
         'unique_words': unique_words,
+        'unique_words_estimated': not exact,
         'avg_words_per_sentence': total_words / total_sentences,
         'avg_chars_per_sentence': total_chars / total_sentences,
-        'min_words': min(word_lengths),
-        'max_words': max(word_lengths),
+        'min_words': min_words,
+        'max_words': max_words,
         'emoji_count': emoji_count,
-        'unique_characters': len(char_freq),
-        'vocabulary_richness': unique_words / total_words if total_words > 0 else 0
+        'unique_characters': int(np.count_nonzero(char_seen)),
+        'vocabulary_richness': unique_words / total_words if total_words > 0 else 0,
+        'fingerprint': fingerprint
     }
     
     return stats
@@ -71,7 +310,8 @@ def print_stats(stats: Dict):
     print(f"Language:              {stats['language']}")
     print(f"Total sentences:       {stats['total_sentences']:,}")
     print(f"Total words:           {stats['total_words']:,}")
-    print(f"Unique words:          {stats['unique_words']:,}")
+    estimated = " (estimated)" if stats.get('unique_words_estimated') else ""
+    print(f"Unique words:          {stats['unique_words']:,}{estimated}")
     print(f"Avg words/sentence:    {stats['avg_words_per_sentence']:.1f}")
     print(f"Avg chars/sentence:    {stats['avg_chars_per_sentence']:.1f}")
     print(f"Word range:            {stats['min_words']}-{stats['max_words']}")
@@ -141,6 +381,16 @@ def validate_dataset_quality(file_path: Path, min_sentences: int = 1000) -> bool
 
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Dataset statistics and validation")
+    parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="Count unique words exactly (memory grows with vocabulary size)"
+    )
+    args = parser.parse_args()
+    
     print("="*70)
     print("Dataset Statistics & Validation")
     print("="*70)
@@ -153,20 +403,43 @@ if __name__ == "__main__":
     ]
     
     all_stats = []
+    output_file = 'data/dataset_stats.json'
+    cached_stats = load_cached_stats(output_file)
     
-    for file_path, lang in datasets:
-        path = Path(file_path)
-        if path.exists():
-            stats = analyze_dataset(path, lang)
+    # Files are independent: analyze them in parallel, report in order
+    with ProcessPoolExecutor(max_workers=len(datasets)) as executor:
+        futures = {}
+        for file_path, lang in datasets:
+            path = Path(file_path)
+            if not path.exists():
+                continue
+            
+            # Reuse saved statistics when the file is unchanged
+            cached = cached_stats.get(file_path)
+            if (cached and cached.get('language') == lang
+                    and not (args.exact and cached.get('unique_words_estimated'))
+                    and cached.get('fingerprint') == file_fingerprint(path)):
+                continue
+            
+            futures[file_path] = executor.submit(analyze_dataset, path, lang, args.exact)
+        
+        for file_path, lang in datasets:
+            if not Path(file_path).exists():
+                print(f"\nSkipped: {file_path} (not found)")
+                continue
+            
+            if file_path in futures:
+                stats = futures[file_path].result()
+            else:
+                stats = cached_stats[file_path]
+                print(f"\nUnchanged: {file_path} (using cached statistics)")
+            
             if stats:
                 print_stats(stats)
                 all_stats.append(stats)
-        else:
-            print(f"\nSkipped: {file_path} (not found)")
     
     # Save stats to JSON
     if all_stats:
-        output_file = 'data/dataset_stats.json'
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(all_stats, f, indent=2, ensure_ascii=False)
         
@@ -3,37 +3,141 @@ Custom Dictionary System
 Fast prefix-based lookup for user-defined mappings
 """
 
-import json
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from collections import defaultdict
+from functools import lru_cache
+from itertools import islice
 import bisect
+import heapq
+import mmap
+import sys
+from types import MappingProxyType
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from utils.json_io import load_json, save_json
+
+try:
+    import marisa_trie
+except ImportError:
+    marisa_trie = None
+
+
+# Shared read-only children mapping for leaf nodes, which are most of a trie
+_NO_CHILDREN = MappingProxyType({})
+
+
+def _values_path(compiled_path) -> Path:
+    """Expansion values file that sits next to a compiled .marisa trie"""
+    compiled_path = Path(compiled_path)
+    return compiled_path.with_name(compiled_path.stem + '.values.bin')
+
+
+@lru_cache(maxsize=256)
+def _normalize_key(key: str) -> str:
+    """Canonical form of a trigger key or search prefix (typing repeats these)"""
+    return key.lower().strip()
 
 
 class PrefixTrie:
     """
     Trie data structure for fast prefix search.
     Optimized for custom dictionary lookups.
+    
+    Every node keeps its best TOP_K completions, ranked by priority then
+    key length, so ranked prefix lookups don't have to walk the subtree.
     """
     
+    # Ranked completions cached per node
+    TOP_K = 16
+    
     class TrieNode:
+        # No per-node __dict__; dictionaries have tens of thousands of nodes
+        __slots__ = ('children', 'is_end', 'value', 'entry', 'top')
+        
         def __init__(self):
-            self.children = {}
+            self.children = _NO_CHILDREN  # Replaced by a dict on first child
             self.is_end = False
             self.value = None
+            self.entry = None  # (-priority, len(key), key, value) when is_end
+            self.top = []  # Best TOP_K entries in this subtree, sorted
     
     def __init__(self):
         self.root = self.TrieNode()
     
-    def insert(self, key: str, value: str):
+    def insert(self, key: str, value: str, priority: int = 0):
         """Insert key-value pair into trie"""
+        if isinstance(value, str):
+            # Many keys expand to the same text; share one copy
+            value = sys.intern(value)
         node = self.root
+        path = [node]
         for char in key:
-            if char not in node.children:
-                node.children[char] = self.TrieNode()
-            node = node.children[char]
+            child = node.children.get(char)
+            if child is None:
+                if node.children is _NO_CHILDREN:
+                    node.children = {}
+                child = node.children[char] = self.TrieNode()
+            node = child
+            path.append(node)
+        
+        replaced = node.is_end
         node.is_end = True
         node.value = value
+        node.entry = (-priority, len(key), key, value)
+        
+        if replaced:
+            # The old entry may have displaced others; recompute bottom-up
+            for path_node in reversed(path):
+                self._refresh_top(path_node)
+        else:
+            for path_node in path:
+                bisect.insort(path_node.top, node.entry)
+                if len(path_node.top) > self.TOP_K:
+                    path_node.top.pop()
+    
+    def _refresh_top(self, node: TrieNode):
+        """Recompute a node's ranked completions from its own entry and its children"""
+        ranked = [child.top for child in node.children.values()]
+        if node.is_end:
+            ranked.append([node.entry])
+        node.top = list(islice(heapq.merge(*ranked), self.TOP_K))
+    
+    def delete(self, key: str) -> bool:
+        """
+        Remove key from trie, pruning branches left without entries.
+        
+        Returns:
+            True if the key was present
+        """
+        node = self.root
+        path = []
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                return False
+            path.append((node, char))
+            node = child
+        
+        if not node.is_end:
+            return False
+        
+        node.is_end = False
+        node.value = None
+        node.entry = None
+        
+        # Walk back up, dropping nodes that no longer lead anywhere
+        while path and not node.is_end and not node.children:
+            parent, char = path.pop()
+            del parent.children[char]
+            node = parent
+        
+        # Remaining ancestors may have ranked the deleted key
+        self._refresh_top(node)
+        for parent, _ in reversed(path):
+            self._refresh_top(parent)
+        
+        return True
     
     def search(self, key: str) -> Optional[str]:
         """Search for exact key match"""
@@ -44,6 +148,20 @@ class PrefixTrie:
             node = node.children[char]
         return node.value if node.is_end else None
     
+    def top_completions(self, prefix: str) -> List[Tuple[int, int, str, str]]:
+        """
+        Best TOP_K completions of prefix, without walking the subtree.
+        
+        Returns:
+            List of (-priority, key_length, key, value) tuples, best first
+        """
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.top
+    
     def prefix_search(self, prefix: str) -> List[Tuple[str, str]]:
         """
         Find all key-value pairs with given prefix.
@@ -69,28 +187,88 @@ class PrefixTrie:
         return results
     
     def _dfs_collect(self, node: TrieNode, current_key: str, results: List[Tuple[str, str]]):
-        """DFS helper to collect all values under a node"""
+        """
+        DFS helper to collect all values under a node.
+        
+        Iterative pre-order walk; the key is kept as a list of characters
+        that is truncated on backtrack, so each key is joined once.
+        """
         if node.is_end:
             results.append((current_key, node.value))
         
-        for char, child in node.children.items():
-            self._dfs_collect(child, current_key + char, results)
+        chars = list(current_key)
+        stack = [(len(chars), char, child) for char, child in reversed(node.children.items())]
+        while stack:
+            depth, char, node = stack.pop()
+            del chars[depth:]
+            chars.append(char)
+            
+            if node.is_end:
+                results.append((''.join(chars), node.value))
+            
+            if node.children:
+                depth += 1
+                stack.extend((depth, c, child) for c, child in reversed(node.children.items()))
 
 
 class CustomDictionary:
     """
     Custom dictionary for user-defined text expansions.
     Supports fast prefix lookup and hot-reload.
+    
+    A dictionary can also be opened read-only from a compiled marisa-trie
+    file (see save_compiled), which is memory-mapped instead of parsed and
+    shared between keyboard processes. The first edit decodes it back into
+    the editable trie.
     """
     
+    # Record stored per key in the compiled trie: (priority, offset, length)
+    # of the UTF-8 value inside the values file
+    COMPILED_FORMAT = '<iII'
+    
     def __init__(self, dict_file: Optional[str] = None):
         self.trie = PrefixTrie()
         self.entries = {}  # key -> value mapping
+        self.max_priority = 0  # Upper bound on any entry's priority
         self.dict_file = dict_file
+        self._compiled = None  # marisa_trie.RecordTrie when opened read-only
+        self._values = None  # mmap of the compiled values file
         
-        if dict_file and Path(dict_file).exists():
+        if dict_file:
+            self._open(dict_file)
+    
+    def _open(self, dict_file: str):
+        """Load dict_file, preferring an up-to-date compiled .marisa sibling"""
+        json_path = Path(dict_file)
+        compiled_path = json_path.with_suffix('.marisa')
+        if (marisa_trie is not None and compiled_path.exists()
+                and _values_path(compiled_path).exists()
+                and (not json_path.exists()
+                     or compiled_path.stat().st_mtime >= json_path.stat().st_mtime)):
+            self.load_compiled(str(compiled_path))
+        elif json_path.exists():
             self.load(dict_file)
     
+    def _materialize(self):
+        """Decode a memory-mapped compiled dictionary into editable entries"""
+        if self._compiled is None:
+            return
+        self.entries = {
+            key: {'value': self._decode_value(offset, length), 'priority': priority}
+            for key, (priority, offset, length) in self._compiled.items()
+        }
+        self._close_compiled()
+        self._rebuild_trie()
+    
+    def _close_compiled(self):
+        self._compiled = None
+        if isinstance(self._values, mmap.mmap):
+            self._values.close()
+        self._values = None
+    
+    def _decode_value(self, offset: int, length: int) -> str:
+        return self._values[offset:offset + length].decode('utf-8')
+    
     def add(self, key: str, value: str, priority: int = 1):
         """
         Add custom dictionary entry.
@@ -100,27 +278,32 @@ class CustomDictionary:
             value: Expansion value (e.g., "thank you")
             priority: Priority for ranking (higher = more important)
         """
-        key = key.lower().strip()
+        self._materialize()
+        key = _normalize_key(key)
         value = value.strip()
         
         self.entries[key] = {
             'value': value,
             'priority': priority
         }
+        self.max_priority = max(self.max_priority, priority)
         
-        self.trie.insert(key, value)
+        self.trie.insert(key, value, priority)
     
     def remove(self, key: str):
         """Remove dictionary entry"""
-        key = key.lower().strip()
+        self._materialize()
+        key = _normalize_key(key)
         if key in self.entries:
             del self.entries[key]
-            # Rebuild trie
-            self._rebuild_trie()
+            self.trie.delete(key)
     
     def get(self, key: str) -> Optional[str]:
         """Get exact match for key"""
-        key = key.lower().strip()
+        key = _normalize_key(key)
+        if self._compiled is not None:
+            records = self._compiled.get(key)
+            return self._decode_value(*records[0][1:]) if records else None
         entry = self.entries.get(key)
         return entry['value'] if entry else None
     
@@ -135,56 +318,127 @@ class CustomDictionary:
         Returns:
             List of expansion values
         """
-        prefix = prefix.lower().strip()
+        prefix = _normalize_key(prefix)
+        
+        if self._compiled is not None:
+            top_matches = heapq.nsmallest(
+                max_results,
+                self._compiled.items(prefix),
+                key=lambda x: (-x[1][0], len(x[0]), x[0])
+            )
+            return [self._decode_value(offset, length)
+                    for _, (_, offset, length) in top_matches]
+        
+        # An exact key is the shortest completion of itself, so it ranks
+        # first unless some entry has a higher priority
+        if max_results == 1:
+            exact = self.entries.get(prefix)
+            if exact is not None and exact.get('priority', 0) >= self.max_priority:
+                return [exact['value']]
+        
+        # Ranked completions are cached on the trie nodes
+        if max_results <= PrefixTrie.TOP_K:
+            return [value for _, _, _, value in self.trie.top_completions(prefix)[:max_results]]
         
         # Get all matches from trie
         matches = self.trie.prefix_search(prefix)
         
-        # Sort by priority (if available) and key length
-        sorted_matches = sorted(
+        # Best max_results by priority (if available), key length, then key
+        top_matches = heapq.nsmallest(
+            max_results,
             matches,
             key=lambda x: (
                 -self.entries.get(x[0], {}).get('priority', 0),
-                len(x[0])
+                len(x[0]),
+                x[0]
             )
         )
         
         # Return values only
-        results = [value for key, value in sorted_matches[:max_results]]
+        results = [value for key, value in top_matches]
         
         return results
     
     def _rebuild_trie(self):
         """Rebuild trie from entries"""
         self.trie = PrefixTrie()
+        self.max_priority = 0
         for key, entry in self.entries.items():
-            self.trie.insert(key, entry['value'])
+            priority = entry.get('priority', 0)
+            self.max_priority = max(self.max_priority, priority)
+            self.trie.insert(key, entry['value'], priority)
     
     def save(self, file_path: str):
         """Save dictionary to JSON file"""
+        self._materialize()
         data = {
             'version': '1.0',
             'entries': self.entries
         }
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        save_json(data, file_path)
     
     def load(self, file_path: str):
         """Load dictionary from JSON file"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = load_json(file_path)
         
+        self._close_compiled()
         self.entries = data.get('entries', {})
         self._rebuild_trie()
     
+    def save_compiled(self, file_path: str):
+        """
+        Save dictionary as a compiled marisa-trie file for read-only use.
+        
+        Keys go into file_path; the expansion values are written next to it
+        in a .values.bin file that load_compiled memory-maps.
+        
+        Args:
+            file_path: Output path, conventionally the JSON path with a
+                .marisa suffix so __init__ picks it up
+        """
+        if marisa_trie is None:
+            raise ImportError("marisa-trie is required for compiled dictionaries")
+        self._materialize()
+        
+        blob = bytearray()
+        records = []
+        for key, entry in self.entries.items():
+            encoded = entry['value'].encode('utf-8')
+            records.append((key, (entry.get('priority', 0), len(blob), len(encoded))))
+            blob += encoded
+        
+        with open(_values_path(file_path), 'wb') as f:
+            f.write(blob)
+        marisa_trie.RecordTrie(self.COMPILED_FORMAT, records).save(file_path)
+    
+    def load_compiled(self, file_path: str):
+        """Memory-map a dictionary written by save_compiled (read-only until edited)"""
+        if marisa_trie is None:
+            raise ImportError("marisa-trie is required for compiled dictionaries")
+        trie = marisa_trie.RecordTrie(self.COMPILED_FORMAT)
+        trie.mmap(file_path)
+        
+        self._close_compiled()
+        values_path = _values_path(file_path)
+        if values_path.stat().st_size:
+            with open(values_path, 'rb') as f:
+                self._values = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._values = b''  # mmap rejects empty files
+        self._compiled = trie
+        self.entries = {}
+        self.trie = PrefixTrie()
+        self.max_priority = 0
+    
     def reload(self):
         """Hot-reload dictionary from file"""
-        if self.dict_file and Path(self.dict_file).exists():
-            self.load(self.dict_file)
+        if self.dict_file:
+            self._open(self.dict_file)
     
     def get_stats(self) -> Dict:
         """Get dictionary statistics"""
+        self._materialize()
         return {
             'total_entries': len(self.entries),
             'avg_key_length': sum(len(k) for k in self.entries) / max(len(self.entries), 1),
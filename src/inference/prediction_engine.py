@@ -4,7 +4,8 @@ Combines model, custom dictionary, and rule engine
 """
 
 import torch
-import numpy as np
+from torch.nn.utils.rnn import pad_sequence
+from collections import OrderedDict
 from typing import List, Tuple, Optional, Dict
 from pathlib import Path
 
@@ -43,12 +44,19 @@ class PredictionEngine:
         # Load tokenizer
         print("Loading tokenizer...")
         self.tokenizer = Tokenizer(tokenizer_path)
+        # Token pieces indexed by ID, so decoding never calls into SentencePiece
+        self._pieces = self.tokenizer.get_pieces()
         
         # Load model
         print("Loading model...")
         self.model = self._load_model(model_path)
         self.model.eval()
         
+        # LSTM state cache: token-id prefix -> (last-step logits, hidden state)
+        self._state_cache = OrderedDict()
+        self._state_cache_size = 256
+        self._last_ids = ()  # Token ids of the previous request
+        
         # Load custom dictionary
         print("Loading custom dictionary...")
         self.dictionary = CustomDictionary(dictionary_path) if dictionary_path else CustomDictionary()
@@ -56,6 +64,7 @@ class PredictionEngine:
         # Load rule engine
         print("Loading rule engine...")
         self.rule_engine = LanguageRuleEngine(rules_config or get_language_rules())
+        self._rule_bias = {}  # language -> logit bias tensor
         
         print("✓ Prediction engine ready!")
     
@@ -65,7 +74,7 @@ class PredictionEngine:
         
         # Get model config
         config = get_model_config()
-        model_config = config['model']
+        model_config = dict(config['model'])
         model_config['vocab_size'] = self.tokenizer.get_vocab_size()
         
         # Create model
@@ -75,6 +84,12 @@ class PredictionEngine:
         model.load_state_dict(checkpoint['model_state_dict'])
         model.to(self.device)
         
+        # Single-token decoding steps replay a CUDA graph instead of
+        # launching each kernel separately
+        if torch.device(self.device).type == 'cuda':
+            model.eval()
+            model.capture_cuda_graph(batch_size=1, seq_len=1)
+        
         return model
     
     def predict(
@@ -98,16 +113,8 @@ class PredictionEngine:
         Returns:
             List of (word, confidence) tuples
         """
-        results = []
-        
         # 1. Check custom dictionary
-        custom_matches = []
-        if include_custom:
-            # Get last word as prefix
-            words = text.strip().split()
-            if words:
-                prefix = words[-1].lower()
-                custom_matches = self.dictionary.prefix_search(prefix, max_results=top_k)
+        custom_matches = self._custom_matches(text, top_k) if include_custom else []
         
         # 2. Get model predictions
         model_predictions = self._get_model_predictions(
@@ -115,6 +122,63 @@ class PredictionEngine:
         )
         
         # 3. Merge results (custom first, then model)
+        return self._merge_predictions(custom_matches, model_predictions, top_k)
+    
+    def predict_batch(
+        self,
+        texts: List[str],
+        language: str = "en",
+        top_k: int = 5,
+        temperature: float = 1.0,
+        include_custom: bool = True
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Predict next words for several texts with one model forward pass.
+        
+        Args:
+            texts: Input texts
+            language: Language code (en, ja)
+            top_k: Number of predictions per text
+            temperature: Sampling temperature
+            include_custom: Whether to include custom dictionary matches
+        
+        Returns:
+            One list of (word, confidence) tuples per text, as from predict()
+        """
+        token_ids = [self.tokenizer.encode(text) for text in texts]
+        rows = [i for i, ids in enumerate(token_ids) if ids]
+        
+        model_predictions = [[] for _ in texts]
+        if rows:
+            logits = self._next_token_logits_batch([token_ids[i] for i in rows])
+            for i, predictions in zip(rows, self._rank_logits(logits, language, top_k * 2, temperature)):
+                model_predictions[i] = predictions
+        
+        return [
+            self._merge_predictions(
+                self._custom_matches(text, top_k) if include_custom else [],
+                predictions,
+                top_k
+            )
+            for text, predictions in zip(texts, model_predictions)
+        ]
+    
+    def _custom_matches(self, text: str, top_k: int) -> List[str]:
+        """Custom dictionary expansions of the last word in text"""
+        # Get last word as prefix
+        words = text.strip().split()
+        if not words:
+            return []
+        return self.dictionary.prefix_search(words[-1].lower(), max_results=top_k)
+    
+    @staticmethod
+    def _merge_predictions(
+        custom_matches: List[str],
+        model_predictions: List[Tuple[str, float]],
+        top_k: int
+    ) -> List[Tuple[str, float]]:
+        """Custom matches first, then model predictions, without duplicates"""
+        results = []
         seen = set()
         
         # Add custom matches with high confidence
@@ -145,43 +209,131 @@ class PredictionEngine:
         if not token_ids:
             return []
         
-        # Convert to tensor
-        x = torch.tensor([token_ids], dtype=torch.long).to(self.device)
-        
-        # Get model predictions
+        logits = self._next_token_logits(token_ids)
+        return self._rank_logits(logits.unsqueeze(0), language, top_k, temperature)[0]
+    
+    def _rank_logits(
+        self,
+        logits: torch.Tensor,
+        language: str,
+        top_k: int,
+        temperature: float
+    ) -> List[List[Tuple[str, float]]]:
+        """Filtered top-k predictions for each row of a (batch, vocab) logits tensor"""
+        # Bias by language rules and keep only the top-k. Softmax is
+        # monotonic, so rank the logits and normalise just the winners
         with torch.no_grad():
-            probs, _ = self.model.predict_next(x, temperature=temperature)
-            probs = probs[0].cpu().numpy()  # (vocab_size,)
+            logits = logits / temperature
+            logits += self._get_rule_bias(language)
+            top_logits, top_indices = torch.topk(logits, min(top_k, logits.size(-1)), dim=-1)
+            top_probs = torch.exp(top_logits - torch.logsumexp(logits, dim=-1, keepdim=True))
+        
+        results = []
+        for indices, confidences in zip(top_indices.tolist(), top_probs.tolist()):
+            predictions = [
+                (self._pieces[idx], confidence)
+                for idx, confidence in zip(indices, confidences)
+            ]
+            
+            # Filter with no-mean filter
+            results.append(self.rule_engine.filter_predictions(predictions, language))
         
-        # Apply language rules (logit biasing)
-        logits = np.log(probs + 1e-10)  # Convert back to logits
+        return results
+    
+    def _next_token_logits(self, token_ids: List[int]) -> torch.Tensor:
+        """
+        Unscaled next-token logits, reusing cached LSTM state.
         
-        # Get token pieces for rule application
-        token_pieces = [self.tokenizer.id_to_piece(i) for i in range(len(logits))]
-        token_ids_list = list(range(len(logits)))
+        Successive keystrokes mostly extend the previous input, so only the
+        tokens after the longest cached prefix are run through the LSTM.
+        """
+        ids = tuple(token_ids)
         
-        # Apply rules
-        logits = self.rule_engine.apply_rules(
-            logits, token_ids_list, token_pieces, language
-        )
+        # Usually the previous input is the longest cached prefix
+        last = self._last_ids
+        if last and len(last) <= len(ids) and ids[:len(last)] == last:
+            cached = self._state_cache.get(last)
+            if cached is not None:
+                self._state_cache.move_to_end(last)
+                if len(last) < len(ids):
+                    cached = self._extend_state(ids, len(last), cached[1])
+                return cached[0]
         
-        # Convert back to probabilities
-        probs = np.exp(logits)
-        probs = probs / probs.sum()  # Renormalize
+        # Longest cached prefix
+        cached_len = 0
+        hidden = None
+        for n in range(len(ids), 0, -1):
+            cached = self._state_cache.get(ids[:n])
+            if cached is not None:
+                self._state_cache.move_to_end(ids[:n])
+                if n == len(ids):
+                    self._last_ids = ids
+                    return cached[0]
+                cached_len = n
+                hidden = cached[1]
+                break
         
-        # Get top-k predictions
-        top_indices = np.argsort(probs)[-top_k:][::-1]
+        return self._extend_state(ids, cached_len, hidden)[0]
+    
+    def _next_token_logits_batch(self, batch: List[List[int]]) -> torch.Tensor:
+        """
+        Next-token logits of shape (len(batch), vocab) for non-empty token lists.
         
-        predictions = []
-        for idx in top_indices:
-            word = self.tokenizer.id_to_piece(int(idx))
-            confidence = float(probs[idx])
-            predictions.append((word, confidence))
+        Inputs without a cached state are right-padded into one tensor and
+        run through the LSTM together; their states are cached as usual.
+        """
+        batch = [tuple(ids) for ids in batch]
+        logits = [None] * len(batch)
+        missing = []
+        for i, ids in enumerate(batch):
+            cached = self._state_cache.get(ids)
+            if cached is None:
+                missing.append(i)
+            else:
+                self._state_cache.move_to_end(ids)
+                logits[i] = cached[0]
+        
+        if missing:
+            lengths = torch.tensor([len(batch[i]) for i in missing], dtype=torch.long)
+            x = pad_sequence(
+                [torch.tensor(batch[i], dtype=torch.long) for i in missing],
+                batch_first=True
+            ).to(self.device)
+            with torch.no_grad():
+                missing_logits, (h, c) = self.model.step(x, lengths=lengths)
+            
+            for row, i in enumerate(missing):
+                logits[i] = missing_logits[row]
+                hidden = (h[:, row:row + 1].contiguous(), c[:, row:row + 1].contiguous())
+                self._state_cache[batch[i]] = (logits[i], hidden)
+                if len(self._state_cache) > self._state_cache_size:
+                    self._state_cache.popitem(last=False)
         
-        # Filter with no-mean filter
-        predictions = self.rule_engine.filter_predictions(predictions, language)
+        return torch.stack(logits)
+    
+    def _extend_state(self, ids: Tuple[int, ...], start: int, hidden) -> Tuple[torch.Tensor, tuple]:
+        """Run ids[start:] from the cached hidden state and cache the result"""
+        x = torch.tensor([ids[start:]], dtype=torch.long, device=self.device)
+        # Replays the captured CUDA graph for one-token steps
+        logits, hidden = self.model.predict_next_logits(x, hidden)
         
-        return predictions
+        entry = (logits[0], hidden)
+        self._state_cache[ids] = entry
+        if len(self._state_cache) > self._state_cache_size:
+            self._state_cache.popitem(last=False)
+        self._last_ids = ids
+        
+        return entry
+    
+    def _get_rule_bias(self, language: str) -> torch.Tensor:
+        """Language rule bias over the vocabulary, built once per language"""
+        bias = self._rule_bias.get(language)
+        if bias is None:
+            bias = torch.from_numpy(
+                self.rule_engine.get_bias_vector(self._pieces, language)
+            ).to(self.device)
+            self._rule_bias[language] = bias
+        return bias
     
     def get_suggestions(
         self,
@@ -5,9 +5,16 @@ Simple, efficient, model-based validation
 """
 
 import json
+import operator
 from pathlib import Path
 from typing import List, Dict, Optional
-from collections import defaultdict
+from collections import Counter, defaultdict
+from functools import lru_cache
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parent))
+from utils.json_io import load_json, loads, save_json
+
 
 class KeyboardSuggestionHandler:
     """
@@ -18,34 +25,62 @@ class KeyboardSuggestionHandler:
     - Fast predictions (<10ms)
     """
     
+    PREFS_FILE = Path('data/user_preferences.json')
+    # Selections since the last full save, one JSON [context, selected] per line
+    PREFS_LOG_FILE = Path('data/user_preferences.log')
+    # Fold the log into PREFS_FILE after this many logged selections
+    COMPACT_EVERY = 1000
+    # Memoized model results (retyped and backspaced inputs repeat a lot)
+    PREDICTION_CACHE_SIZE = 2048
+    
     def __init__(self, primary_language: str = "japanese"):
         self.current_language = primary_language
         
-        # Load models
-        self.models = self._load_models()
+        # Load the primary language model; others are built on first use
+        self._model_factories = self._get_model_factories()
+        self.models = {}
+        self._get_model(primary_language)
+        self._cached_predictions = lru_cache(maxsize=self.PREDICTION_CACHE_SIZE)(self._model_predictions)
         
         # Self-learning: track user selections
-        self.frequency_tracker = defaultdict(int)  # "context→word" → count
+        self.frequency_tracker = defaultdict(Counter)  # context → {word: count}
+        self._prefs_log = None
+        self._pending_count = 0
         self.load_user_preferences()
         
         print(f"✓ Keyboard initialized with {primary_language}")
     
-    def _load_models(self) -> Dict:
-        """Load language models"""
-        import sys
-        from pathlib import Path
-        
-        # Add scripts to path
-        scripts_dir = Path(__file__).parent.parent / 'scripts'
-        sys.path.insert(0, str(scripts_dir))
-        
-        from enhanced_predictive_engine import EnhancedJapanesePredictiveEngine
+    def _get_model_factories(self) -> Dict:
+        """Language → zero-argument model constructor"""
+        def japanese():
+            import sys
+            
+            # Add scripts to path
+            scripts_dir = Path(__file__).parent.parent / 'scripts'
+            sys.path.insert(0, str(scripts_dir))
+            
+            from enhanced_predictive_engine import EnhancedJapanesePredictiveEngine
+            return EnhancedJapanesePredictiveEngine()
         
         return {
-            "japanese": EnhancedJapanesePredictiveEngine(),
-            # "english": EnglishEngine(),  # Add when needed
+            "japanese": japanese,
+            # "english": english,  # Add when needed
         }
     
+    def _get_model(self, language: str):
+        """Model for language, imported and built the first time it is needed"""
+        model = self.models.get(language)
+        if model is None:
+            factory = self._model_factories.get(language)
+            if factory is None:
+                return None
+            model = self.models[language] = factory()
+        return model
+    
+    def _model_predictions(self, input_text: str, context: str, language: str) -> tuple:
+        """Raw model suggestions; wrapped in an LRU cache per instance"""
+        return tuple(self._get_model(language).get_predictions(input_text, {"preceding_text": context}))
+    
     def get_suggestions(self, input_text: str, context: str = "", max_suggestions: int = 5) -> List[str]:
         """
         Get suggestions for input text
@@ -64,14 +99,14 @@ class KeyboardSuggestionHandler:
         """
         
         # Get model for current language
-        model = self.models.get(self.current_language)
+        model = self._get_model(self.current_language)
         if not model:
             return []
         
         # Model predicts - naturally filters garbage
         try:
-            # Get base suggestions from model
-            suggestions = model.get_predictions(input_text, {"preceding_text": context})
+            # Get base suggestions from model (memoized)
+            suggestions = list(self._cached_predictions(input_text, context, self.current_language))
             
             # Filter garbage: if only suggestion is the input itself, it's likely garbage
             if len(suggestions) == 1 and suggestions[0] == input_text:
@@ -98,41 +133,47 @@ class KeyboardSuggestionHandler:
         if not text:
             return True
         
+        # One C-level counting pass; the checks below work on the counts
+        length = len(text)
+        char_counts = Counter(text)
+        
         # Check for excessive repetition (ccccccc)
-        if len(text) > 3:
-            unique_chars = len(set(text))
-            if unique_chars / len(text) < 0.3:  # Less than 30% unique chars
+        if length > 3:
+            if len(char_counts) / length < 0.3:  # Less than 30% unique chars
                 return True
         
         # Check for random character spam (cacjjsacascm)
         # If text has many consonant clusters or random patterns
-        if len(text) > 5:
-            # Count transitions between different character types
-            transitions = 0
-            for i in range(len(text) - 1):
-                if text[i] != text[i+1]:
-                    transitions += 1
+        if length > 5:
+            # Count transitions between different characters
+            transitions = length - 1 - sum(map(operator.eq, text, text[1:]))
             
             # Too many transitions = random spam
-            if transitions / len(text) > 0.8:  # More than 80% transitions
+            if transitions / length > 0.8:  # More than 80% transitions
                 return True
         
         # Check for too many numbers/special chars
-        num_count = sum(c.isdigit() for c in text)
-        special_count = sum(not c.isalnum() for c in text)
+        num_count = 0
+        special_count = 0
+        alpha_count = 0
+        for char, count in char_counts.items():
+            if char.isdigit():
+                num_count += count
+            if not char.isalnum():
+                special_count += count
+            if char.isalpha():
+                alpha_count += count
         
-        if len(text) > 0:
-            if num_count / len(text) > 0.5:  # More than 50% numbers
-                return True
-            if special_count / len(text) > 0.5:  # More than 50% special chars
+        if num_count / length > 0.5:  # More than 50% numbers
+            return True
+        if special_count / length > 0.5:  # More than 50% special chars
+            return True
+        
+        # Mixed garbage (numbers + letters + special)
+        if num_count > 0 and alpha_count > 0 and special_count > 0:
+            # If all three types present and no clear pattern
+            if num_count / length > 0.3 and special_count / length > 0.1:
                 return True
-            
-            # Mixed garbage (numbers + letters + special)
-            alpha_count = sum(c.isalpha() for c in text)
-            if num_count > 0 and alpha_count > 0 and special_count > 0:
-                # If all three types present and no clear pattern
-                if num_count / len(text) > 0.3 and special_count / len(text) > 0.1:
-                    return True
         
         return False
     
@@ -147,18 +188,13 @@ class KeyboardSuggestionHandler:
         Returns:
             Reordered suggestions with user preferences prioritized
         """
-        
-        # Score each suggestion based on user history
-        scored = []
-        for suggestion in suggestions:
-            key = f"{context}→{suggestion}"
-            frequency = self.frequency_tracker.get(key, 0)
-            scored.append((frequency, suggestion))
+        # Most calls have no history for this context or these suggestions
+        context_counts = self.frequency_tracker.get(context)
+        if not context_counts or context_counts.keys().isdisjoint(suggestions):
+            return suggestions
         
         # Sort by frequency (descending), keep original order for ties
-        scored.sort(key=lambda x: x[0], reverse=True)
-        
-        return [s for _, s in scored]
+        return sorted(suggestions, key=context_counts.__getitem__, reverse=True)
     
     def record_selection(self, context: str, selected: str):
         """
@@ -168,11 +204,16 @@ class KeyboardSuggestionHandler:
             context: Context when selection was made
             selected: What user selected
         """
-        key = f"{context}→{selected}"
-        self.frequency_tracker[key] += 1
+        self.frequency_tracker[context][selected] += 1
         
-        # Auto-save every 10 selections
-        if sum(self.frequency_tracker.values()) % 10 == 0:
+        # Append to the selection log; rewrite the full file only occasionally
+        if self._prefs_log is None:
+            self.PREFS_LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+            self._prefs_log = open(self.PREFS_LOG_FILE, 'a', encoding='utf-8', buffering=1)
+        self._prefs_log.write(json.dumps([context, selected], ensure_ascii=False) + '\n')
+        
+        self._pending_count += 1
+        if self._pending_count >= self.COMPACT_EVERY:
             self.save_user_preferences()
     
     def switch_language(self, language: str):
@@ -182,28 +223,55 @@ class KeyboardSuggestionHandler:
         Args:
             language: "japanese" or "english"
         """
-        if language in self.models:
+        if language in self._model_factories:
             self.current_language = language
+            self._cached_predictions.cache_clear()
             print(f"✓ Switched to {language}")
         else:
             print(f"✗ Language {language} not available")
     
     def save_user_preferences(self):
-        """Save user's learning data"""
-        prefs_file = Path('data/user_preferences.json')
-        prefs_file.parent.mkdir(parents=True, exist_ok=True)
+        """Save user's learning data and clear the selection log it now covers"""
+        self.PREFS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        
+        save_json(
+            {context: dict(counts) for context, counts in self.frequency_tracker.items()},
+            self.PREFS_FILE
+        )
         
-        with open(prefs_file, 'w', encoding='utf-8') as f:
-            json.dump(dict(self.frequency_tracker), f, ensure_ascii=False, indent=2)
+        if self._prefs_log is not None:
+            self._prefs_log.close()
+            self._prefs_log = None
+        self.PREFS_LOG_FILE.unlink(missing_ok=True)
+        self._pending_count = 0
     
     def load_user_preferences(self):
-        """Load user's learning data"""
-        prefs_file = Path('data/user_preferences.json')
+        """Load user's learning data, replaying selections logged since the last save"""
+        self.frequency_tracker = defaultdict(Counter)
+        
+        if self.PREFS_FILE.exists():
+            data = load_json(self.PREFS_FILE)
+            
+            for key, value in data.items():
+                if isinstance(value, dict):
+                    self.frequency_tracker[key].update(value)
+                else:
+                    # Older flat format: "context→word" → count
+                    context, _, word = key.rpartition('→')
+                    self.frequency_tracker[context][word] += value
+        
+        self._pending_count = 0
+        if self.PREFS_LOG_FILE.exists():
+            with open(self.PREFS_LOG_FILE, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        context, selected = loads(line)
+                    except ValueError:
+                        continue  # Partially written last line
+                    self.frequency_tracker[context][selected] += 1
+                    self._pending_count += 1
         
-        if prefs_file.exists():
-            with open(prefs_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.frequency_tracker = defaultdict(int, data)
+        if self.frequency_tracker:
             print(f"✓ Loaded {len(self.frequency_tracker)} user preferences")
 
 
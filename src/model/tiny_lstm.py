@@ -5,7 +5,8 @@ Optimized for mobile deployment with minimal size
 
 import torch
 import torch.nn as nn
-from typing import Tuple, Optional
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+from typing import Callable, Tuple, Optional, Union
 
 
 class TinyLSTM(nn.Module):
@@ -23,6 +24,9 @@ class TinyLSTM(nn.Module):
         hidden_dim: Dimension of LSTM hidden state
         num_layers: Number of LSTM layers
         dropout: Dropout probability
+        tie_weights: Share the embedding table with the output layer; when
+            embedding_dim != hidden_dim a small hidden -> embedding
+            projection is added in front of the output layer
     """
     
     def __init__(
@@ -31,7 +35,8 @@ class TinyLSTM(nn.Module):
         embedding_dim: int = 64,
         hidden_dim: int = 128,
         num_layers: int = 1,
-        dropout: float = 0.2
+        dropout: float = 0.2,
+        tie_weights: bool = False
     ):
         super(TinyLSTM, self).__init__()
         
@@ -39,6 +44,7 @@ class TinyLSTM(nn.Module):
         self.embedding_dim = embedding_dim
         self.hidden_dim = hidden_dim
         self.num_layers = num_layers
+        self.tie_weights = tie_weights
         
         # Embedding layer
         self.embedding = nn.Embedding(vocab_size, embedding_dim)
@@ -52,20 +58,34 @@ class TinyLSTM(nn.Module):
             dropout=dropout if num_layers > 1 else 0
         )
         
-        # Dropout for regularization
+        # Dropout for regularization (embedding dropout is applied per
+        # vocabulary row in _embed)
         self.dropout = nn.Dropout(dropout)
+        self.embedding_dropout = dropout
         
-        # Output layer
-        self.fc = nn.Linear(hidden_dim, vocab_size)
+        # Output layer, optionally sharing the embedding table (halves the
+        # two largest weight matrices)
+        self.proj = None
+        if tie_weights and embedding_dim != hidden_dim:
+            self.proj = nn.Linear(hidden_dim, embedding_dim, bias=False)
+        self.fc = nn.Linear(embedding_dim if tie_weights else hidden_dim, vocab_size)
+        if tie_weights:
+            self.fc.weight = self.embedding.weight
         
         # Initialize weights
         self._init_weights()
+        
+        # Set by capture_cuda_graph()
+        self._cuda_graph = None
     
     def _init_weights(self):
         """Initialize weights with Xavier uniform initialization"""
         nn.init.xavier_uniform_(self.embedding.weight)
-        nn.init.xavier_uniform_(self.fc.weight)
+        if not self.tie_weights:
+            nn.init.xavier_uniform_(self.fc.weight)
         nn.init.zeros_(self.fc.bias)
+        if self.proj is not None:
+            nn.init.xavier_uniform_(self.proj.weight)
         
         # Initialize LSTM weights
         for name, param in self.lstm.named_parameters():
@@ -74,6 +94,23 @@ class TinyLSTM(nn.Module):
             elif 'bias' in name:
                 nn.init.zeros_(param)
     
+    def _embed(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Embed tokens, with embedding dropout while training.
+        
+        Whole vocabulary rows are dropped for the step, so the mask is
+        gathered per token (batch, seq) instead of drawn per element
+        (batch, seq, embedding_dim).
+        """
+        embedded = self.embedding(x)
+        if self.training and self.embedding_dropout > 0:
+            keep = 1.0 - self.embedding_dropout
+            mask = torch.bernoulli(
+                torch.full((self.vocab_size,), keep, dtype=embedded.dtype, device=x.device)
+            ) / keep
+            embedded = embedded * mask[x].unsqueeze(-1)
+        return embedded
+    
     def forward(
         self,
         x: torch.Tensor,
@@ -91,8 +128,7 @@ class TinyLSTM(nn.Module):
             hidden: Hidden state tuple (h_n, c_n)
         """
         # Embedding: (batch_size, seq_len) -> (batch_size, seq_len, embedding_dim)
-        embedded = self.embedding(x)
-        embedded = self.dropout(embedded)
+        embedded = self._embed(x)
         
         # LSTM: (batch_size, seq_len, embedding_dim) -> (batch_size, seq_len, hidden_dim)
         if hidden is None:
@@ -104,10 +140,157 @@ class TinyLSTM(nn.Module):
         lstm_out = self.dropout(lstm_out)
         
         # Output: (batch_size, seq_len, hidden_dim) -> (batch_size, seq_len, vocab_size)
-        output = self.fc(lstm_out)
+        output = self._output(lstm_out)
         
         return output, hidden
     
+    def step(
+        self,
+        x: torch.Tensor,
+        hidden: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+        lengths: Optional[torch.Tensor] = None
+    ) -> Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
+        """
+        Advance the LSTM over x and project only the last step to the vocabulary.
+        
+        Args:
+            x: Input tensor of shape (batch_size, seq_len), usually the tokens
+               that follow an already-processed prefix
+            hidden: Hidden state after that prefix
+            lengths: Optional CPU tensor of per-row lengths when x is
+               right-padded; each row's last real step is used
+        
+        Returns:
+            logits: Logits of shape (batch_size, vocab_size)
+            hidden: Updated hidden state
+        """
+        if lengths is None:
+            return self.forward_last(x, hidden)
+        
+        # Packing keeps padding out of the final hidden state
+        embedded = self._embed(x)
+        packed = pack_padded_sequence(embedded, lengths, batch_first=True, enforce_sorted=False)
+        packed_out, hidden = self.lstm(packed, hidden)
+        lstm_out, _ = pad_packed_sequence(packed_out, batch_first=True)
+        last = lstm_out[torch.arange(lstm_out.size(0)), lengths - 1]
+        return self._output(self.dropout(last)), hidden
+    
+    @torch.jit.export
+    def forward_last(
+        self,
+        x: torch.Tensor,
+        hidden: Optional[Tuple[torch.Tensor, torch.Tensor]] = None
+    ) -> Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
+        """
+        Like forward(), but only the last position goes through the output layer.
+        
+        The vocabulary projection is the largest matmul in the model, so
+        this skips (seq_len - 1) / seq_len of the work when only the next
+        token matters (training targets, prediction).
+        
+        Args:
+            x: Input tensor of shape (batch_size, seq_len)
+            hidden: Optional hidden state tuple (h_0, c_0)
+        
+        Returns:
+            logits: Logits of shape (batch_size, vocab_size)
+            hidden: Hidden state tuple (h_n, c_n)
+        """
+        embedded = self._embed(x)
+        lstm_out, hidden = self.lstm(embedded, hidden)
+        return self._output(self.dropout(lstm_out[:, -1, :])), hidden
+    
+    def _output(self, lstm_out: torch.Tensor) -> torch.Tensor:
+        """Vocabulary logits from LSTM outputs"""
+        if self.proj is not None:
+            lstm_out = self.proj(lstm_out)
+        return self.fc(lstm_out)
+    
+    def predict_next_logits(
+        self,
+        x: torch.Tensor,
+        hidden: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+        temperature: float = 1.0
+    ) -> Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
+        """
+        Temperature-scaled logits for the next token.
+        
+        Args:
+            x: Input tensor of shape (batch_size, seq_len)
+            hidden: Optional hidden state
+            temperature: Temperature for softmax (higher = more random)
+        
+        Returns:
+            logits: Logits of shape (batch_size, vocab_size)
+            hidden: Updated hidden state
+        """
+        with torch.no_grad():
+            if self._cuda_graph is not None and x.shape == self._cuda_graph[1].shape:
+                logits, hidden = self._replay_cuda_graph(x, hidden)
+            else:
+                logits, hidden = self.step(x, hidden)
+            return logits / temperature, hidden
+    
+    def capture_cuda_graph(self, batch_size: int = 1, seq_len: int = 1):
+        """
+        Capture step() for one input shape into a CUDA graph.
+        
+        predict_next/predict_next_logits then replay the graph for inputs of
+        that shape instead of launching each kernel separately. Call after
+        moving the model to CUDA and calling eval().
+        
+        Args:
+            batch_size: Batch size of the captured input
+            seq_len: Sequence length of the captured input (1 for
+                token-by-token decoding from a cached hidden state)
+        """
+        device = next(self.parameters()).device
+        if device.type != 'cuda':
+            raise ValueError("CUDA graphs require the model on a CUDA device")
+        
+        static_x = torch.zeros((batch_size, seq_len), dtype=torch.long, device=device)
+        state_shape = (self.num_layers, batch_size, self.hidden_dim)
+        static_h = torch.zeros(state_shape, device=device).contiguous()
+        static_c = torch.zeros(state_shape, device=device).contiguous()
+        
+        with torch.no_grad():
+            # Warm up on a side stream so lazy initialisation isn't captured
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                for _ in range(3):
+                    self.step(static_x, (static_h, static_c))
+            torch.cuda.current_stream().wait_stream(stream)
+            
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                static_logits, (static_h_out, static_c_out) = self.step(static_x, (static_h, static_c))
+        
+        self._cuda_graph = (
+            graph, static_x, static_h, static_c,
+            static_logits, static_h_out, static_c_out
+        )
+    
+    def _replay_cuda_graph(
+        self,
+        x: torch.Tensor,
+        hidden: Optional[Tuple[torch.Tensor, torch.Tensor]]
+    ) -> Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
+        """Run the captured graph on x; outputs are copied out of the static buffers"""
+        graph, static_x, static_h, static_c, logits, h_out, c_out = self._cuda_graph
+        
+        static_x.copy_(x, non_blocking=True)
+        if hidden is None:
+            static_h.zero_()
+            static_c.zero_()
+        else:
+            static_h.copy_(hidden[0], non_blocking=True)
+            static_c.copy_(hidden[1], non_blocking=True)
+        
+        graph.replay()
+        
+        return logits.clone(), (h_out.clone(), c_out.clone())
+    
     def predict_next(
         self,
         x: torch.Tensor,
@@ -126,16 +309,37 @@ class TinyLSTM(nn.Module):
             probs: Probabilities of shape (batch_size, vocab_size)
             hidden: Updated hidden state
         """
-        with torch.no_grad():
-            output, hidden = self.forward(x, hidden)
-            
-            # Get logits for last token
-            logits = output[:, -1, :] / temperature
-            
-            # Apply softmax
-            probs = torch.softmax(logits, dim=-1)
-            
-            return probs, hidden
+        logits, hidden = self.predict_next_logits(x, hidden, temperature)
+        
+        # Apply softmax
+        probs = torch.softmax(logits, dim=-1)
+        
+        return probs, hidden
+    
+    def quantize(self, backend: str = 'qnnpack') -> nn.Module:
+        """
+        Dynamically quantized copy for CPU inference.
+        
+        LSTM and Linear weights are stored as int8 and activations are
+        quantized on the fly, so weight traffic drops by 4x. The embedding
+        stays FP32.
+        
+        Args:
+            backend: Quantized engine ('qnnpack' for ARM/mobile, 'fbgemm' for x86)
+        
+        Returns:
+            Quantized module with the same forward() signature
+        """
+        # Weights are packed for the engine selected at conversion time;
+        # the process-wide setting is restored afterwards
+        previous_engine = torch.backends.quantized.engine
+        torch.backends.quantized.engine = backend
+        try:
+            return torch.ao.quantization.quantize_dynamic(
+                self, {nn.LSTM, nn.Linear}, dtype=torch.qint8
+            )
+        finally:
+            torch.backends.quantized.engine = previous_engine
     
     def get_model_size(self) -> float:
         """
@@ -159,6 +363,19 @@ class TinyLSTM(nn.Module):
         return sum(p.numel() for p in self.parameters() if p.requires_grad)
 
 
+def compile_tiny_lstm(model: Union[nn.Module, Callable]) -> Callable:
+    """
+    Wrap model (or one of its methods) with torch.compile for
+    per-keystroke / per-batch forwards.
+    
+    A compiled module's state_dict keys gain an '_orig_mod.' prefix, so
+    save checkpoints from the original module. nn.LSTM causes graph breaks,
+    which run eagerly (fullgraph=False).
+    """
+    # dynamic=True: sequence lengths vary between keystrokes and batches
+    return torch.compile(model, mode='reduce-overhead', fullgraph=False, dynamic=True)
+
+
 def create_model(config: dict) -> TinyLSTM:
     """
     Create TinyLSTM model from configuration.
@@ -174,7 +391,8 @@ def create_model(config: dict) -> TinyLSTM:
         embedding_dim=config.get('embedding_dim', 64),
         hidden_dim=config.get('hidden_dim', 128),
         num_layers=config.get('num_layers', 1),
-        dropout=config.get('dropout', 0.2)
+        dropout=config.get('dropout', 0.2),
+        tie_weights=config.get('tie_weights', False)
     )
     
     return model
@@ -199,3 +417,16 @@ if __name__ == "__main__":
     # Test prediction
     probs, _ = model.predict_next(x)
     print(f"Prediction probabilities shape: {probs.shape}")
+    
+    # Test CUDA graph replay against eager single-token steps
+    if torch.cuda.is_available():
+        model = model.cuda().eval()
+        model.capture_cuda_graph(batch_size=1, seq_len=1)
+        x = torch.randint(0, 25000, (1, 1), device='cuda')
+        _, hidden = model.predict_next_logits(x)
+        with torch.no_grad():
+            expected, _ = model.step(x, hidden)
+        replayed, _ = model.predict_next_logits(x, hidden)
+        print(f"CUDA graph vs eager max logit diff: {(replayed - expected).abs().max().item():.6f}")
+    else:
+        print("Skipping CUDA graph test (no CUDA device)")
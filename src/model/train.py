@@ -8,16 +8,25 @@ import torch.optim as optim
 from pathlib import Path
 from tqdm import tqdm
 import json
-from typing import Dict, Tuple
+import os
+from typing import Dict, Optional, Tuple
 
 import sys
 sys.path.append('src')
 
-from model.tiny_lstm import TinyLSTM
+from model.tiny_lstm import TinyLSTM, compile_tiny_lstm
 from tokenizer.train_tokenizer import Tokenizer
 from utils.dataset import create_dataloaders
 from utils.config_loader import get_model_config
 
+try:
+    from torchao.quantization.qat import Int8DynActInt4WeightQATQuantizer
+except ImportError:
+    Int8DynActInt4WeightQATQuantizer = None
+
+# Batches between progress-bar loss updates (each update syncs with the device)
+LOG_INTERVAL = 50
+
 
 class Trainer:
     """Trainer for TinyLSTM model"""
@@ -29,14 +38,33 @@ class Trainer:
         val_loader,
         device: str = "cpu",
         learning_rate: float = 0.001,
-        gradient_clip: float = 1.0
+        gradient_clip: float = 1.0,
+        compile_model: bool = False
     ):
         self.model = model.to(device)
+        # Last-position forward (the loss only uses the final token), possibly
+        # compiled; self.model stays the plain module so checkpoints keep
+        # their usual state_dict keys
+        self.forward_model = self.model.forward_last
+        if compile_model:
+            print("Compiling model with torch.compile (first batch will be slow)...")
+            self.forward_model = compile_tiny_lstm(self.model.forward_last)
         self.train_loader = train_loader
         self.val_loader = val_loader
         self.device = device
         self.gradient_clip = gradient_clip
         
+        # Mixed precision on CUDA: bfloat16 where supported, otherwise
+        # float16 with loss scaling (the scaler is a no-op when disabled)
+        self.device_type = torch.device(device).type
+        self.use_amp = self.device_type == 'cuda'
+        self.amp_dtype = (
+            torch.bfloat16 if self.use_amp and torch.cuda.is_bf16_supported() else torch.float16
+        )
+        self.scaler = torch.amp.GradScaler(
+            self.device_type, enabled=self.use_amp and self.amp_dtype == torch.float16
+        )
+        
         # Loss and optimizer
         self.criterion = nn.CrossEntropyLoss(ignore_index=0)  # Ignore padding
         self.optimizer = optim.Adam(model.parameters(), lr=learning_rate)
@@ -54,43 +82,48 @@ class Trainer:
     def train_epoch(self) -> Tuple[float, float]:
         """Train for one epoch"""
         self.model.train()
-        total_loss = 0
+        # Accumulated on the device; read back once per epoch
+        total_loss = torch.zeros((), device=self.device)
+        running_loss = torch.zeros((), device=self.device)
         num_batches = 0
         
         pbar = tqdm(self.train_loader, desc="Training")
         for contexts, targets in pbar:
-            contexts = contexts.to(self.device)
-            targets = targets.to(self.device)
-            
-            # Forward pass
-            self.optimizer.zero_grad()
-            outputs, _ = self.model(contexts)
+            contexts = contexts.to(self.device, non_blocking=True)
+            targets = targets.to(self.device, non_blocking=True)
             
-            # Get predictions for last token
-            predictions = outputs[:, -1, :]
-            
-            # Calculate loss
-            loss = self.criterion(predictions, targets)
+            # Forward pass (predictions for the last token only)
+            self.optimizer.zero_grad(set_to_none=True)
+            with torch.autocast(self.device_type, dtype=self.amp_dtype, enabled=self.use_amp):
+                predictions, _ = self.forward_model(contexts)
+                
+                # Calculate loss
+                loss = self.criterion(predictions, targets)
             
             # Backward pass
-            loss.backward()
+            self.scaler.scale(loss).backward()
             
-            # Gradient clipping
+            # Gradient clipping (on unscaled gradients)
+            self.scaler.unscale_(self.optimizer)
             torch.nn.utils.clip_grad_norm_(
                 self.model.parameters(),
                 self.gradient_clip
             )
             
-            self.optimizer.step()
+            self.scaler.step(self.optimizer)
+            self.scaler.update()
             
             # Update metrics
-            total_loss += loss.item()
+            total_loss += loss.detach()
+            running_loss += loss.detach()
             num_batches += 1
             
-            # Update progress bar
-            pbar.set_postfix({'loss': f'{loss.item():.4f}'})
+            # Update progress bar with the mean loss since the last update
+            if num_batches % LOG_INTERVAL == 0:
+                pbar.set_postfix({'loss': f'{(running_loss / LOG_INTERVAL).item():.4f}'})
+                running_loss.zero_()
         
-        avg_loss = total_loss / num_batches
+        avg_loss = (total_loss / num_batches).item()
         perplexity = torch.exp(torch.tensor(avg_loss)).item()
         
         return avg_loss, perplexity
@@ -98,25 +131,25 @@ class Trainer:
     def validate(self) -> Tuple[float, float]:
         """Validate model"""
         self.model.eval()
-        total_loss = 0
+        total_loss = torch.zeros((), device=self.device)
         num_batches = 0
         
-        with torch.no_grad():
+        with torch.inference_mode():
             for contexts, targets in tqdm(self.val_loader, desc="Validating"):
-                contexts = contexts.to(self.device)
-                targets = targets.to(self.device)
+                contexts = contexts.to(self.device, non_blocking=True)
+                targets = targets.to(self.device, non_blocking=True)
                 
                 # Forward pass
-                outputs, _ = self.model(contexts)
-                predictions = outputs[:, -1, :]
-                
-                # Calculate loss
-                loss = self.criterion(predictions, targets)
+                with torch.autocast(self.device_type, dtype=self.amp_dtype, enabled=self.use_amp):
+                    predictions, _ = self.forward_model(contexts)
+                    
+                    # Calculate loss
+                    loss = self.criterion(predictions, targets)
                 
-                total_loss += loss.item()
+                total_loss += loss.float()
                 num_batches += 1
         
-        avg_loss = total_loss / num_batches
+        avg_loss = (total_loss / num_batches).item()
         perplexity = torch.exp(torch.tensor(avg_loss)).item()
         
         return avg_loss, perplexity
@@ -197,14 +230,113 @@ class Trainer:
         print(f"\n✓ Training completed!")
         print(f"Best validation loss: {self.best_val_loss:.4f}")
         print(f"Training history saved to: {history_path}")
+    
+    def fine_tune_qat(self, num_epochs: int, save_dir: str = "models", groupsize: int = 32):
+        """
+        Quantization-aware fine-tuning of the best checkpoint (requires torchao).
+        
+        Linear layers get int8 dynamic-activation / int4 weight fake quantization,
+        so the model learns weights that survive low-bit export.
+        
+        Args:
+            num_epochs: Number of QAT epochs
+            save_dir: Directory holding best_model.pt; QAT checkpoints go here too
+            groupsize: Weight quantization group size (must divide hidden_dim)
+        """
+        if Int8DynActInt4WeightQATQuantizer is None:
+            raise ImportError("torchao is required for QAT: pip install torchao")
+        if num_epochs < 1:
+            raise ValueError(f"num_epochs must be at least 1, got {num_epochs}")
+        
+        save_path = Path(save_dir)
+        checkpoint = torch.load(save_path / "best_model.pt", map_location=self.device)
+        self.model.load_state_dict(checkpoint['model_state_dict'])
+        
+        plain_keys = self.model.state_dict().keys()
+        linears = {
+            name: module for name, module in self.model.named_modules()
+            if isinstance(module, nn.Linear)
+        }
+        
+        quantizer = Int8DynActInt4WeightQATQuantizer(groupsize=groupsize)
+        self.model = quantizer.prepare(self.model)
+        
+        # Keep only fake-quantized linears that reuse the original weight and
+        # bias (some torchao versions build them without a bias, and a copied
+        # weight would untie fc from the embedding)
+        num_prepared = 0
+        for name, linear in linears.items():
+            prepared = self.model.get_submodule(name)
+            if prepared is linear:
+                continue
+            if prepared.weight is not linear.weight or prepared.bias is not linear.bias:
+                parent_name, _, child_name = name.rpartition('.')
+                setattr(self.model.get_submodule(parent_name), child_name, linear)
+                print(f"  Skipping QAT for {name}: the quantizer did not keep its parameters")
+            else:
+                num_prepared += 1
+        
+        if self.model.state_dict().keys() != plain_keys:
+            raise RuntimeError("QAT model parameters no longer match TinyLSTM")
+        if num_prepared == 0:
+            print("⚠️  No linear layer could be fake-quantized; skipping QAT fine-tuning")
+            return
+        print(f"  Fake-quantizing {num_prepared}/{len(linears)} linear layers")
+        self.forward_model = self.model.forward_last
+        
+        # Fine-tune gently from the converged weights
+        learning_rate = self.optimizer.param_groups[0]['lr'] * 0.1
+        self.optimizer = optim.Adam(self.model.parameters(), lr=learning_rate)
+        
+        print(f"\nQAT fine-tuning for {num_epochs} epochs...")
+        for epoch in range(num_epochs):
+            print(f"\nQAT Epoch {epoch + 1}/{num_epochs}")
+            print("-" * 50)
+            
+            train_loss, train_ppl = self.train_epoch()
+            val_loss, val_ppl = self.validate()
+            
+            print(f"\nTrain Loss: {train_loss:.4f} | Train PPL: {train_ppl:.2f}")
+            print(f"Val Loss: {val_loss:.4f} | Val PPL: {val_ppl:.2f}")
+        
+        # Fake-quantized linears share the original parameters (checked
+        # above), so this loads into a plain TinyLSTM as a drop-in FP32
+        # replacement
+        qat_path = save_path / "qat_model.pt"
+        torch.save({
+            'model_state_dict': self.model.state_dict(),
+            'val_loss': val_loss,
+            'val_perplexity': val_ppl,
+        }, qat_path)
+        print(f"✓ Saved QAT model: {qat_path}")
+        
+        self.model = quantizer.convert(self.model)
+        self.forward_model = self.model.forward_last
+        
+        int4_path = save_path / "qat_int4_model.pt"
+        torch.save({'model_state_dict': self.model.state_dict()}, int4_path)
+        print(f"✓ Saved int8/int4 model: {int4_path}")
 
 
-def main():
-    """Main training function"""
+def main(
+    data_file: str = "data/processed/combined_train.txt",
+    num_epochs: Optional[int] = None,
+    qat_epochs: int = 0,
+    export: bool = False
+):
+    """
+    Main training function.
+    
+    Args:
+        data_file: Path to training text file
+        num_epochs: Number of epochs (defaults to the training config)
+        qat_epochs: Quantization-aware fine-tuning epochs after training (0 = off)
+        export: Also export frozen TorchScript and int8 lite models after training
+    """
     
     # Load configuration
     config = get_model_config()
-    model_config = config['model']
+    model_config = dict(config['model'])
     training_config = config['training']
     
     # Set device
@@ -222,11 +354,14 @@ def main():
     # Create dataloaders
     print("\nCreating dataloaders...")
     train_loader, val_loader = create_dataloaders(
-        train_file="data/processed/combined_train.txt",
+        train_file=data_file,
         tokenizer=tokenizer,
         batch_size=training_config['batch_size'],
         max_seq_length=config['data']['max_sequence_length'],
-        validation_split=training_config['validation_split']
+        validation_split=training_config['validation_split'],
+        # Background collation into pinned memory overlaps host-to-GPU copies
+        num_workers=(os.cpu_count() or 2) // 2 if device == "cuda" else 0,
+        pin_memory=device == "cuda"
     )
     
     # Create model
@@ -242,15 +377,90 @@ def main():
         val_loader=val_loader,
         device=device,
         learning_rate=training_config['learning_rate'],
-        gradient_clip=training_config['gradient_clip']
+        gradient_clip=training_config['gradient_clip'],
+        compile_model=training_config.get('compile', False)
     )
     
     # Train
     trainer.train(
-        num_epochs=training_config['num_epochs'],
+        num_epochs=num_epochs or training_config['num_epochs'],
         early_stopping_patience=training_config['early_stopping_patience']
     )
+    
+    if qat_epochs:
+        trainer.fine_tune_qat(qat_epochs)
+    
+    if export:
+        export_for_inference("models/best_model.pt", model_config)
+
+
+def export_for_inference(
+    model_path: str,
+    model_config: Dict,
+    output_dir: str = "models/mobile"
+):
+    """
+    Export frozen TorchScript and int8 lite-interpreter models of a checkpoint.
+    
+    Failures are reported, not raised: the checkpoint stays the training
+    result and can be exported later with utils/export_model.py.
+    
+    Args:
+        model_path: Path to the trained checkpoint
+        model_config: Model hyperparameters
+        output_dir: Output directory for the exported models
+    """
+    try:
+        from utils.export_model import ModelExporter
+        
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        
+        checkpoint = torch.load(model_path, map_location='cpu')
+        model = TinyLSTM(**model_config)
+        model.load_state_dict(checkpoint['model_state_dict'])
+        model.eval()
+        
+        exporter = ModelExporter(model, model_config['vocab_size'])
+        exporter.export_to_torchscript(str(output_path / "tiny_lstm.pt"))
+        exporter.export_quantized_lite(str(output_path / "tiny_lstm.ptl"))
+    except Exception as e:
+        print(f"Warning: export failed ({e})")
+        print(f"  Trained model: {model_path}")
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Train TinyLSTM model")
+    parser.add_argument(
+        "--data-file",
+        default="data/processed/combined_train.txt",
+        help="Path to training text file"
+    )
+    parser.add_argument(
+        "--epochs",
+        type=int,
+        default=None,
+        help="Number of epochs (defaults to config)"
+    )
+    
+    parser.add_argument(
+        "--qat-epochs",
+        type=int,
+        default=0,
+        help="Quantization-aware fine-tuning epochs after training (needs torchao)"
+    )
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help="Export TorchScript and int8 lite models after training"
+    )
+    
+    args = parser.parse_args()
+    main(
+        data_file=args.data_file,
+        num_epochs=args.epochs,
+        qat_epochs=args.qat_epochs,
+        export=args.export
+    )
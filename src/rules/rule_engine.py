@@ -5,6 +5,8 @@ Applies boost/suppress weights to model predictions
 
 import re
 import math
+from collections import Counter, defaultdict
+from functools import lru_cache
 from typing import List, Dict, Tuple, Optional
 import numpy as np
 
@@ -15,6 +17,9 @@ class NoMeanFilter:
     Detects spam, keyboard mashing, and low-entropy sequences.
     """
     
+    # Memoized text checks per filter
+    CACHE_SIZE = 8192
+    
     def __init__(
         self,
         min_entropy: float = 2.0,
@@ -31,34 +36,59 @@ class NoMeanFilter:
         self.compiled_patterns = [
             re.compile(pattern) for pattern in self.blocked_patterns
         ]
+        
+        # Group-free patterns are OR-ed into one regex so a single scan covers
+        # them; patterns with groups stay separate (combining would renumber
+        # their backreferences)
+        plain = [p.pattern for p in self.compiled_patterns if not p.groups]
+        self._pattern_checks = [p.search for p in self.compiled_patterns if p.groups]
+        if plain:
+            try:
+                self._pattern_checks.insert(0, re.compile('|'.join(f'(?:{p})' for p in plain)).search)
+            except re.error:
+                # e.g. inline global flags, which must start the whole pattern
+                self._pattern_checks = [p.search for p in self.compiled_patterns]
+        
+        # Candidates come from a fixed vocabulary, so the same strings are
+        # filtered over and over
+        self._text_is_meaningful = lru_cache(maxsize=self.CACHE_SIZE)(self._check_text)
     
-    def calculate_entropy(self, text: str) -> float:
+    def _stats(self, text: str) -> Tuple[float, float]:
         """
-        Calculate Shannon entropy of text.
+        Shannon entropy and most-common-character ratio from one counting pass.
         
         Args:
-            text: Input text
+            text: Non-empty input text
         
         Returns:
-            Entropy value
+            (entropy, repetition_ratio)
         """
-        if not text:
-            return 0.0
-        
         # Count character frequencies
-        char_counts = {}
-        for char in text:
-            char_counts[char] = char_counts.get(char, 0) + 1
+        char_counts = Counter(text).values()
         
         # Calculate entropy
         length = len(text)
         entropy = 0.0
         
-        for count in char_counts.values():
+        for count in char_counts:
             prob = count / length
             entropy -= prob * math.log2(prob)
         
-        return entropy
+        return entropy, max(char_counts) / length
+    
+    def calculate_entropy(self, text: str) -> float:
+        """
+        Calculate Shannon entropy of text.
+        
+        Args:
+            text: Input text
+        
+        Returns:
+            Entropy value
+        """
+        if not text:
+            return 0.0
+        return self._stats(text)[0]
     
     def calculate_repetition_ratio(self, text: str) -> float:
         """
@@ -72,18 +102,12 @@ class NoMeanFilter:
         """
         if not text:
             return 0.0
-        
-        char_counts = {}
-        for char in text:
-            char_counts[char] = char_counts.get(char, 0) + 1
-        
-        max_count = max(char_counts.values())
-        return max_count / len(text)
+        return self._stats(text)[1]
     
     def matches_blocked_pattern(self, text: str) -> bool:
         """Check if text matches any blocked pattern"""
-        for pattern in self.compiled_patterns:
-            if pattern.search(text):
+        for search in self._pattern_checks:
+            if search(text):
                 return True
         return False
     
@@ -102,21 +126,29 @@ class NoMeanFilter:
         if confidence < self.min_confidence:
             return False
         
+        return self._text_is_meaningful(text)
+    
+    def _check_text(self, text: str) -> bool:
+        """Confidence-independent checks; memoized per instance as _text_is_meaningful"""
         # Check blocked patterns
         if self.matches_blocked_pattern(text):
             return False
         
+        entropy, repetition = self._stats(text) if text else (0.0, 0.0)
+        
         # Check entropy
-        entropy = self.calculate_entropy(text)
         if entropy < self.min_entropy:
             return False
         
         # Check repetition
-        repetition = self.calculate_repetition_ratio(text)
         if repetition > self.max_repetition_ratio:
             return False
         
         return True
+    
+    def clear_cache(self):
+        """Forget memoized results, e.g. after changing thresholds or patterns"""
+        self._text_is_meaningful.cache_clear()
 
 
 class LanguageRuleEngine:
@@ -128,6 +160,13 @@ class LanguageRuleEngine:
     def __init__(self, rules_config: Dict):
         self.rules_config = rules_config
         self.no_mean_filter = self._create_no_mean_filter()
+        
+        # Vocabulary the rule indices were built for, and per-language
+        # (boost_ids, suppress_ids, boost_weight, suppress_weight)
+        self._vocab_pieces = None
+        self._vocab_size = 0
+        self._piece_ids = {}
+        self._rule_indices = {}
     
     def _create_no_mean_filter(self) -> NoMeanFilter:
         """Create no-mean filter from config"""
@@ -168,21 +207,76 @@ class LanguageRuleEngine:
         if not rules:
             return logits
         
-        # Get boost and suppress tokens
-        boost_tokens = rules.get('boost_tokens', [])
-        suppress_tokens = rules.get('suppress_tokens', [])
-        boost_weight = rules.get('boost_weight', 0.5)
-        suppress_weight = rules.get('suppress_weight', -1.0)
+        boost_ids, suppress_ids, boost_weight, suppress_weight = self._get_rule_indices(
+            token_pieces, language, rules
+        )
         
         # Apply boosts
-        for i, piece in enumerate(token_pieces):
-            if piece in boost_tokens:
-                logits[i] += boost_weight
-            elif piece in suppress_tokens:
-                logits[i] += suppress_weight
+        logits[boost_ids] += boost_weight
+        logits[suppress_ids] += suppress_weight
         
         return logits
     
+    def _get_rule_indices(
+        self,
+        token_pieces: List[str],
+        language: str,
+        rules: Dict
+    ) -> Tuple[np.ndarray, np.ndarray, float, float]:
+        """Vocabulary indices of a language's boosted and suppressed tokens, built once"""
+        # Rebuilt when called with a different vocabulary list
+        if token_pieces is not self._vocab_pieces or len(token_pieces) != self._vocab_size:
+            self._vocab_pieces = token_pieces
+            self._vocab_size = len(token_pieces)
+            self._piece_ids = defaultdict(list)
+            for i, piece in enumerate(token_pieces):
+                self._piece_ids[piece].append(i)
+            self._rule_indices = {}
+        
+        cached = self._rule_indices.get(language)
+        if cached is None:
+            # Get boost and suppress tokens
+            boost_tokens = rules.get('boost_tokens', [])
+            suppress_tokens = rules.get('suppress_tokens', [])
+            
+            # A token listed under both is only boosted
+            boost_ids = [i for piece in dict.fromkeys(boost_tokens) for i in self._piece_ids.get(piece, ())]
+            suppress_ids = [
+                i for piece in dict.fromkeys(suppress_tokens) if piece not in boost_tokens
+                for i in self._piece_ids.get(piece, ())
+            ]
+            
+            cached = (
+                np.array(boost_ids, dtype=np.int64),
+                np.array(suppress_ids, dtype=np.int64),
+                rules.get('boost_weight', 0.5),
+                rules.get('suppress_weight', -1.0)
+            )
+            self._rule_indices[language] = cached
+        
+        return cached
+    
+    def get_bias_vector(
+        self,
+        token_pieces: List[str],
+        language: str = "en"
+    ) -> np.ndarray:
+        """
+        Additive logit bias for the whole vocabulary.
+        
+        Equivalent to apply_rules() on zero logits, so callers can compute
+        it once per language and add it to every prediction.
+        
+        Args:
+            token_pieces: Token pieces (strings), indexed by token ID
+            language: Language code
+        
+        Returns:
+            Bias array of shape (vocab_size,)
+        """
+        bias = np.zeros(len(token_pieces), dtype=np.float32)
+        return self.apply_rules(bias, list(range(len(token_pieces))), token_pieces, language)
+    
     def filter_predictions(
         self,
         predictions: List[Tuple[str, float]],
@@ -2,6 +2,7 @@
 SentencePiece tokenizer training and utilities
 """
 
+import os
 import sentencepiece as spm
 from pathlib import Path
 from typing import List, Optional
@@ -56,6 +57,7 @@ class TokenizerTrainer:
             '--unk_id=1',
             '--bos_id=2',
             '--eos_id=3',
+            f'--num_threads={os.cpu_count() or 1}',
             '--user_defined_symbols=😊,😂,❤️,🎉,👀,😴,🌙,💤,🤔,🥳,🎊,👏,😋,🍣,🔥,🥰',  # Common emoji
         ]
         
@@ -102,10 +104,11 @@ class TokenizerTrainer:
         print(f"\nTesting tokenizer on {len(test_texts)} samples:")
         print("=" * 80)
         
-        for text in test_texts:
-            tokens = sp.encode_as_pieces(text)
-            ids = sp.encode_as_ids(text)
-            
+        num_threads = os.cpu_count() or 1
+        all_tokens = sp.encode(test_texts, out_type=str, num_threads=num_threads)
+        all_ids = sp.encode(test_texts, out_type=int, num_threads=num_threads)
+        
+        for text, tokens, ids in zip(test_texts, all_tokens, all_ids):
             print(f"\nText: {text}")
             print(f"Tokens: {tokens}")
             print(f"IDs: {ids}")
@@ -128,11 +131,34 @@ class Tokenizer:
         self.unk_id = self.sp.unk_id()
         self.bos_id = self.sp.bos_id()
         self.eos_id = self.sp.eos_id()
+        
+        # Piece tables, so lookups never cross into SentencePiece
+        self._id2piece = [self.sp.id_to_piece(i) for i in range(self.vocab_size)]
+        self._piece2id = {piece: i for i, piece in enumerate(self._id2piece)}
     
     def encode(self, text: str) -> List[int]:
         """Encode text to token IDs"""
         return self.sp.encode_as_ids(text)
     
+    def encode_batch(
+        self,
+        texts: List[str],
+        num_threads: Optional[int] = None
+    ) -> List[List[int]]:
+        """
+        Encode many texts in one SentencePiece call.
+        
+        Args:
+            texts: Texts to encode
+            num_threads: Encoder threads (None = one per CPU core)
+        
+        Returns:
+            Token IDs for each text
+        """
+        if num_threads is None:
+            num_threads = os.cpu_count() or 1
+        return self.sp.encode(texts, out_type=int, num_threads=num_threads)
+    
     def decode(self, ids: List[int]) -> str:
         """Decode token IDs to text"""
         return self.sp.decode_ids(ids)
@@ -145,13 +171,17 @@ class Tokenizer:
         """Get vocabulary size"""
         return self.vocab_size
     
+    def get_pieces(self) -> List[str]:
+        """Get all token pieces, indexed by token ID"""
+        return self._id2piece
+    
     def id_to_piece(self, token_id: int) -> str:
         """Convert token ID to piece"""
-        return self.sp.id_to_piece(token_id)
+        return self._id2piece[token_id]
     
     def piece_to_id(self, piece: str) -> int:
         """Convert piece to token ID"""
-        return self.sp.piece_to_id(piece)
+        return self._piece2id.get(piece, self.unk_id)
 
 
 if __name__ == "__main__":
@@ -3,32 +3,54 @@ Configuration loader utilities
 """
 
 import yaml
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any
+from types import MappingProxyType
+from typing import Mapping, Any
 
+# libyaml-backed parser when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
-def load_yaml_config(config_path: str) -> Dict[str, Any]:
+
+def _freeze(value: Any) -> Any:
+    """Recursively make parsed YAML read-only (dicts -> mapping proxies, lists -> tuples)"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@lru_cache(maxsize=32)
+def _load_yaml_cached(path_str: str, mtime_ns: int) -> Mapping[str, Any]:
+    """Parse a YAML file; cached per (path, modification time)"""
+    with open(path_str, 'r', encoding='utf-8') as f:
+        return _freeze(yaml.load(f, Loader=_YAML_LOADER))
+
+
+def load_yaml_config(config_path: str) -> Mapping[str, Any]:
     """
     Load YAML configuration file.
     
+    Parsed files are cached until they change on disk, so the result is
+    read-only; copy a section (e.g. dict(config['model'])) to modify it.
+    
     Args:
         config_path: Path to YAML config file
     
     Returns:
-        Configuration dictionary
+        Configuration mapping
     """
     config_path = Path(config_path)
     
     if not config_path.exists():
         raise FileNotFoundError(f"Config file not found: {config_path}")
     
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config = yaml.safe_load(f)
-    
-    return config
+    path = config_path.resolve()
+    return _load_yaml_cached(str(path), path.stat().st_mtime_ns)
 
 
-def get_model_config(config_dir: str = "config") -> Dict[str, Any]:
+def get_model_config(config_dir: str = "config") -> Mapping[str, Any]:
     """
     Load model configuration.
     
@@ -36,13 +58,13 @@ def get_model_config(config_dir: str = "config") -> Dict[str, Any]:
         config_dir: Directory containing config files
     
     Returns:
-        Model configuration dictionary
+        Model configuration mapping
     """
     config_path = Path(config_dir) / "model_config.yaml"
     return load_yaml_config(str(config_path))
 
 
-def get_language_rules(config_dir: str = "config") -> Dict[str, Any]:
+def get_language_rules(config_dir: str = "config") -> Mapping[str, Any]:
     """
     Load language rules configuration.
     
@@ -50,7 +72,7 @@ def get_language_rules(config_dir: str = "config") -> Dict[str, Any]:
         config_dir: Directory containing config files
     
     Returns:
-        Language rules dictionary
+        Language rules mapping
     """
     config_path = Path(config_dir) / "language_rules.yaml"
     return load_yaml_config(str(config_path))
@@ -2,12 +2,30 @@
 Data preparation utilities for training dataset
 """
 
-import re
 import json
+import multiprocessing
+import os
+from contextlib import ExitStack
+from functools import partial
+from itertools import chain
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Iterator, List, Dict, Optional, Tuple
 from collections import Counter
 
+# Read/write buffer size, also the size of each batch of input lines
+IO_BUFFER_SIZE = 1 << 20
+
+# Input files up to this size are read and split in one go
+READ_ALL_MAX_BYTES = 256 << 20
+
+# Most lines sent to a worker process at once
+PROCESS_CHUNK_LINES = 10000
+
+
+def _process_chunk(preparator: 'DataPreparator', lines: List[str]) -> List[str]:
+    """Cleaned valid lines of a chunk (module-level so worker processes can run it)"""
+    return list(filter(None, map(preparator._process_line, lines)))
+
 
 class DataPreparator:
     """Prepare and clean text data for training"""
@@ -26,13 +44,9 @@ class DataPreparator:
         Returns:
             Cleaned text
         """
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Strip leading/trailing whitespace
-        text = text.strip()
-        
-        return text
+        # Collapse whitespace runs and strip leading/trailing whitespace
+        # (str.split() splits on the same characters as \s)
+        return ' '.join(text.split())
     
     def is_valid_sequence(self, text: str) -> bool:
         """
@@ -44,22 +58,61 @@ class DataPreparator:
         Returns:
             True if valid, False otherwise
         """
-        # Check length
-        words = text.split()
-        if len(words) < self.min_length or len(words) > self.max_length:
+        # Check length (splitting stops once the text is known to be too long)
+        num_words = len(text.split(None, self.max_length))
+        if num_words < self.min_length or num_words > self.max_length:
             return False
         
         # Check for spam patterns (all same character)
-        if len(set(text.replace(' ', ''))) < 3:
+        chars = set(text)
+        chars.discard(' ')
+        if len(chars) < 3:
             return False
         
         return True
     
+    def _process_line(self, line: str) -> Optional[str]:
+        """
+        clean_text + is_valid_sequence fused for the dataset loop: the line
+        is split into words once and that split serves both.
+        
+        Returns:
+            Cleaned text, or None if the line is not a valid sequence
+        """
+        words = line.split()
+        if len(words) < self.min_length or len(words) > self.max_length:
+            return None
+        
+        cleaned = ' '.join(words)
+        chars = set(cleaned)
+        chars.discard(' ')
+        if len(chars) < 3:
+            return None
+        
+        return cleaned
+    
+    def _read_line_batches(self, input_file: str) -> Iterator[List[str]]:
+        """Lines of a file in batches; a single batch if the file is small enough to read at once"""
+        path = Path(input_file)
+        if path.stat().st_size <= READ_ALL_MAX_BYTES:
+            # One read + C-level split; split('\n') rather than splitlines(),
+            # which would also break lines at \x1c, \u2028, etc.
+            lines = path.read_text(encoding='utf-8').split('\n')
+            if not lines[-1]:
+                lines.pop()  # A trailing newline doesn't start another line
+            yield lines
+            return
+        
+        with open(path, 'r', encoding='utf-8', buffering=IO_BUFFER_SIZE) as f:
+            yield from iter(lambda: f.readlines(IO_BUFFER_SIZE), [])
+    
     def prepare_dataset(
         self,
         input_files: List[str],
         output_file: str,
-        language: str = "en"
+        language: str = "en",
+        deduplicate: bool = False,
+        num_workers: Optional[int] = None
     ) -> Dict[str, int]:
         """
         Prepare dataset from input files.
@@ -68,40 +121,70 @@ class DataPreparator:
             input_files: List of input file paths
             output_file: Output file path
             language: Language code
+            deduplicate: Write each distinct line once (first occurrence
+                kept); repeated chat lines otherwise yield the same training
+                windows many times over
+            num_workers: Processes cleaning lines in parallel (default: one
+                per CPU core; 1 = in this process)
         
         Returns:
             Statistics dictionary
         """
-        all_texts = []
         total_lines = 0
         valid_lines = 0
+        written_lines = 0
+        seen = set()
         
-        # Read all input files
-        for input_file in input_files:
-            if not Path(input_file).exists():
-                print(f"Warning: File not found: {input_file}")
-                continue
-            
-            with open(input_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    total_lines += 1
-                    cleaned = self.clean_text(line)
-                    
-                    if self.is_valid_sequence(cleaned):
-                        all_texts.append(cleaned)
-                        valid_lines += 1
-        
-        # Write to output file
         output_path = Path(output_file)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for text in all_texts:
-                f.write(text + '\n')
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        process_chunk = partial(_process_chunk, self)
+        
+        # Stream accepted lines to a temporary file (an input may also be the
+        # output), one batch of input lines at a time; map/filter keep the
+        # per-line loop out of the interpreter. With several workers, large
+        # batches are split into chunks cleaned in parallel (in order)
+        tmp_path = output_path.with_name(output_path.name + '.tmp')
+        with ExitStack() as stack:
+            pool = None
+            out_f = stack.enter_context(open(tmp_path, 'w', encoding='utf-8', buffering=IO_BUFFER_SIZE))
+            
+            # Read all input files
+            for input_file in input_files:
+                if not Path(input_file).exists():
+                    print(f"Warning: File not found: {input_file}")
+                    continue
+                
+                for lines in self._read_line_batches(input_file):
+                    total_lines += len(lines)
+                    
+                    if num_workers <= 1 or len(lines) <= PROCESS_CHUNK_LINES:
+                        accepted = process_chunk(lines)
+                    else:
+                        if pool is None:
+                            pool = stack.enter_context(multiprocessing.Pool(num_workers))
+                        chunk_size = max(1, min(PROCESS_CHUNK_LINES, -(-len(lines) // num_workers)))
+                        chunks = (lines[i:i + chunk_size] for i in range(0, len(lines), chunk_size))
+                        accepted = list(chain.from_iterable(pool.imap(process_chunk, chunks)))
+                    valid_lines += len(accepted)
+                    
+                    if deduplicate:
+                        accepted = [text for text in dict.fromkeys(accepted) if text not in seen]
+                        seen.update(accepted)
+                    
+                    if accepted:
+                        written_lines += len(accepted)
+                        accepted.append('')
+                        out_f.write('\n'.join(accepted))
+        
+        tmp_path.replace(output_path)
         
         stats = {
             'total_lines': total_lines,
             'valid_lines': valid_lines,
+            'duplicate_lines': valid_lines - written_lines,
             'output_file': output_file,
             'language': language
         }
@@ -2,10 +2,98 @@
 Dataset class for PyTorch training
 """
 
+import copy
+import hashlib
+import json
+import numpy as np
 import torch
-from torch.utils.data import Dataset, DataLoader
-from typing import List, Tuple
+from torch.utils.data import Dataset, DataLoader, Sampler
+from typing import Iterator, List, Optional, Tuple
 from pathlib import Path
+from itertools import chain
+
+# Lines tokenized per batched encoder call
+ENCODE_CHUNK_SIZE = 10000
+
+# Text files up to this size are read and split in one go
+READ_ALL_MAX_BYTES = 256 << 20
+
+# Encoded into the cache metadata so a retrained tokenizer invalidates it
+# (for tokenizers that don't expose their vocabulary)
+_PROBE_TEXT = "The quick brown fox, 今日はいい天気ですね 😊"
+
+
+def _tokenizer_fingerprint(tokenizer) -> str:
+    """Hash of the tokenizer's vocabulary, or of a probe encoding"""
+    if hasattr(tokenizer, 'get_pieces'):
+        data = '\n'.join(tokenizer.get_pieces())
+    else:
+        data = repr(list(tokenizer.encode(_PROBE_TEXT)))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _encode_lines(tokenizer, lines: List[str]) -> List[List[int]]:
+    """Tokenize lines, in one call when the tokenizer supports batching"""
+    if hasattr(tokenizer, 'encode_batch'):
+        return tokenizer.encode_batch(lines)
+    return [tokenizer.encode(line) for line in lines]
+
+
+def pretokenize(text_file: str, tokenizer) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tokenize a text file once into memory-mapped arrays.
+    
+    Token IDs of all non-empty lines are stored back to back in
+    <name>.tokens.npy (uint16 when the vocabulary fits, else uint32), with
+    line boundaries in <name>.lines.npy. The cache is rebuilt when the text
+    file or the tokenizer changes.
+    
+    Args:
+        text_file: Path to text file
+        tokenizer: Tokenizer instance
+    
+    Returns:
+        tokens: Concatenated token IDs
+        line_offsets: Start offset of each line in tokens, plus the end
+    """
+    text_path = Path(text_file)
+    tokens_path = text_path.with_suffix('.tokens.npy')
+    lines_path = text_path.with_suffix('.lines.npy')
+    meta_path = text_path.with_suffix('.tokens.json')
+    
+    vocab_size = tokenizer.get_vocab_size()
+    meta = {
+        'source_mtime': text_path.stat().st_mtime,
+        'vocab_size': vocab_size,
+        'tokenizer': _tokenizer_fingerprint(tokenizer)
+    }
+    
+    if not (meta_path.exists() and json.loads(meta_path.read_text()) == meta):
+        print(f"Tokenizing {text_file}...")
+        dtype = np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+        
+        if text_path.stat().st_size <= READ_ALL_MAX_BYTES:
+            # One read + C-level split (splitlines() would also break at
+            # \x1c, \u2028, etc., which file iteration does not)
+            lines = text_path.read_text(encoding='utf-8').split('\n')
+        else:
+            with open(text_file, 'r', encoding='utf-8', buffering=1 << 20) as f:
+                lines = list(f)
+        lines = [line for line in map(str.strip, lines) if line]
+        
+        token_chunks = [np.zeros(0, dtype=dtype)]
+        line_lengths = [np.zeros(1, dtype=np.int64)]
+        for start in range(0, len(lines), ENCODE_CHUNK_SIZE):
+            ids = _encode_lines(tokenizer, lines[start:start + ENCODE_CHUNK_SIZE])
+            token_chunks.append(np.fromiter(chain.from_iterable(ids), dtype=dtype))
+            line_lengths.append(np.fromiter(map(len, ids), dtype=np.int64, count=len(ids)))
+        
+        np.save(tokens_path, np.concatenate(token_chunks))
+        np.save(lines_path, np.cumsum(np.concatenate(line_lengths)))
+        # Written last: marks the arrays as complete
+        meta_path.write_text(json.dumps(meta))
+    
+    return np.load(tokens_path, mmap_mode='r'), np.load(lines_path, mmap_mode='r')
 
 
 class NextWordDataset(Dataset):
@@ -15,6 +103,9 @@ class NextWordDataset(Dataset):
     Creates (context, target) pairs where:
     - context: sequence of tokens
     - target: next token to predict
+    
+    Samples are views into the memory-mapped token array from pretokenize(),
+    so the corpus is tokenized once and never held as Python lists.
     """
     
     def __init__(
@@ -37,47 +128,106 @@ class NextWordDataset(Dataset):
         self.max_seq_length = max_seq_length
         self.min_seq_length = min_seq_length
         
-        # Load and tokenize all texts
-        self.sequences = []
-        self._load_data(text_file)
-    
-    def _load_data(self, text_file: str):
-        """Load and prepare training sequences"""
-        with open(text_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Tokenize
-                token_ids = self.tokenizer.encode(line)
-                
-                # Skip if too short
-                if len(token_ids) < self.min_seq_length:
-                    continue
-                
-                # Create sliding window sequences
-                for i in range(1, len(token_ids)):
-                    # Get context (all tokens up to i)
-                    context = token_ids[max(0, i - self.max_seq_length):i]
-                    target = token_ids[i]
-                    
-                    self.sequences.append((context, target))
+        # Load (tokenizing on first use) all texts
+        self.tokens, line_offsets = pretokenize(text_file, tokenizer)
+        self._index_samples(np.asarray(line_offsets))
+    
+    def _index_samples(self, line_offsets: np.ndarray):
+        """Context start and target position of every sliding-window sample"""
+        starts, ends = line_offsets[:-1], line_offsets[1:]
+        
+        # Skip lines that are too short
+        keep = ends - starts >= self.min_seq_length
+        starts, ends = starts[keep], ends[keep]
+        
+        # Every token after the first in a line is a target
+        counts = ends - starts - 1
+        first_sample = np.cumsum(counts) - counts
+        line_starts = np.repeat(starts, counts)
+        self.positions = line_starts + 1 + np.arange(counts.sum()) - np.repeat(first_sample, counts)
+        
+        # Context: up to max_seq_length tokens before the target, within its line
+        self.starts = np.maximum(line_starts, self.positions - self.max_seq_length)
+    
+    def select(self, indices: np.ndarray) -> 'NextWordDataset':
+        """
+        Dataset of the given samples, sharing the token array.
+        
+        Unlike torch.utils.data.Subset the sample arrays themselves are
+        indexed, so __getitem__ has no extra indirection.
+        """
+        view = copy.copy(self)
+        view.starts = self.starts[indices]
+        view.positions = self.positions[indices]
+        return view
+    
+    def context_lengths(self) -> np.ndarray:
+        """Context length of every sample"""
+        return self.positions - self.starts
     
     def __len__(self) -> int:
-        return len(self.sequences)
+        return len(self.positions)
+    
+    def __getitem__(self, idx: int) -> Tuple[np.ndarray, int]:
+        start, position = self.starts[idx], self.positions[idx]
+        
+        # A view into the token array; collate_fn builds the batch tensors
+        return self.tokens[start:position], int(self.tokens[position])
+
+
+class BucketBatchSampler(Sampler):
+    """
+    Shuffled batches of similar-length samples, so little of each batch is
+    padding.
+    
+    Indices are shuffled, sorted by length within pools of
+    pool_batches * batch_size, cut into batches, and the batches shuffled.
     
-    def __getitem__(self, idx: int) -> Tuple[torch.Tensor, torch.Tensor]:
-        context, target = self.sequences[idx]
+    Args:
+        lengths: Context length of every sample
+        batch_size: Samples per batch
+        pool_batches: Batches per sorting pool (larger = tighter buckets,
+            less randomness)
+        drop_last: Drop each pool's last batch if it is incomplete
+    """
+    
+    def __init__(
+        self,
+        lengths: np.ndarray,
+        batch_size: int,
+        pool_batches: int = 100,
+        drop_last: bool = False
+    ):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.pool_size = batch_size * pool_batches
+        self.drop_last = drop_last
+    
+    def __iter__(self) -> Iterator[List[int]]:
+        order = torch.randperm(len(self.lengths)).numpy()
         
-        # Convert to tensors
-        context_tensor = torch.tensor(context, dtype=torch.long)
-        target_tensor = torch.tensor(target, dtype=torch.long)
+        batches = []
+        for pool_start in range(0, len(order), self.pool_size):
+            pool = order[pool_start:pool_start + self.pool_size]
+            pool = pool[np.argsort(self.lengths[pool], kind='stable')]
+            for start in range(0, len(pool), self.batch_size):
+                batch = pool[start:start + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch)
         
-        return context_tensor, target_tensor
+        for i in torch.randperm(len(batches)).tolist():
+            yield batches[i].tolist()
+    
+    def __len__(self) -> int:
+        num_full_pools, last_pool = divmod(len(self.lengths), self.pool_size)
+        if self.drop_last:
+            last_batches = last_pool // self.batch_size
+        else:
+            last_batches = -(-last_pool // self.batch_size)
+        return num_full_pools * (self.pool_size // self.batch_size) + last_batches
 
 
-def collate_fn(batch: List[Tuple[torch.Tensor, torch.Tensor]]) -> Tuple[torch.Tensor, torch.Tensor]:
+def collate_fn(batch: List[Tuple[np.ndarray, int]]) -> Tuple[torch.Tensor, torch.Tensor]:
     """
     Collate function for DataLoader.
     Pads sequences to same length in batch.
@@ -93,17 +243,13 @@ def collate_fn(batch: List[Tuple[torch.Tensor, torch.Tensor]]) -> Tuple[torch.Te
     # Find max length in batch
     max_len = max(len(c) for c in contexts)
     
-    # Pad contexts
-    padded_contexts = []
-    for context in contexts:
-        # Pad with 0 (pad token)
-        padding = torch.zeros(max_len - len(context), dtype=torch.long)
-        padded = torch.cat([padding, context])
-        padded_contexts.append(padded)
+    # Left-pad contexts with 0 (pad token) into one preallocated batch
+    padded = np.zeros((len(contexts), max_len), dtype=np.int64)
+    for i, context in enumerate(contexts):
+        padded[i, max_len - len(context):] = context
     
-    # Stack into batch
-    contexts_batch = torch.stack(padded_contexts)
-    targets_batch = torch.stack(targets)
+    contexts_batch = torch.from_numpy(padded)
+    targets_batch = torch.tensor(targets, dtype=torch.long)
     
     return contexts_batch, targets_batch
 
@@ -114,7 +260,8 @@ def create_dataloaders(
     batch_size: int = 128,
     max_seq_length: int = 50,
     validation_split: float = 0.1,
-    num_workers: int = 0
+    num_workers: int = 0,
+    pin_memory: Optional[bool] = None
 ) -> Tuple[DataLoader, DataLoader]:
     """
     Create train and validation dataloaders.
@@ -126,6 +273,8 @@ def create_dataloaders(
         max_seq_length: Maximum sequence length
         validation_split: Fraction of data for validation
         num_workers: Number of worker processes
+        pin_memory: Collate into page-locked memory for async copies to the
+            GPU (default: when CUDA is available)
     
     Returns:
         Train and validation dataloaders
@@ -142,26 +291,42 @@ def create_dataloaders(
     val_size = int(total_size * validation_split)
     train_size = total_size - val_size
     
-    train_dataset, val_dataset = torch.utils.data.random_split(
-        full_dataset,
-        [train_size, val_size]
-    )
+    # Same permutation as random_split, but the splits index the sample
+    # arrays directly
+    permutation = torch.randperm(total_size).numpy()
+    train_dataset = full_dataset.select(permutation[:train_size])
+    val_dataset = full_dataset.select(permutation[train_size:])
     
     # Create dataloaders
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+    loader_kwargs = {
+        'collate_fn': collate_fn,
+        'num_workers': num_workers,
+        'pin_memory': pin_memory
+    }
+    if num_workers > 0:
+        # Keep workers alive across epochs and batches queued ahead
+        loader_kwargs.update(persistent_workers=True, prefetch_factor=4)
+    
+    # Length-bucketed batches: the LSTM runs over less padding. Incomplete
+    # batches are dropped so every training step has the same batch size
+    train_sampler = BucketBatchSampler(
+        train_dataset.context_lengths(),
+        batch_size,
+        drop_last=True
+    )
     train_loader = DataLoader(
         train_dataset,
-        batch_size=batch_size,
-        shuffle=True,
-        collate_fn=collate_fn,
-        num_workers=num_workers
+        batch_sampler=train_sampler,
+        **loader_kwargs
     )
     
     val_loader = DataLoader(
         val_dataset,
         batch_size=batch_size,
         shuffle=False,
-        collate_fn=collate_fn,
-        num_workers=num_workers
+        **loader_kwargs
     )
     
     print(f"Dataset created:")
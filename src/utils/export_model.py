@@ -3,9 +3,11 @@ Model export utilities for mobile deployment
 Supports ONNX export and quantization
 """
 
+import inspect
 import torch
 import torch.onnx
 from pathlib import Path
+from typing import Dict, Optional
 import onnx
 import onnxruntime as ort
 import numpy as np
@@ -35,30 +37,114 @@ class ModelExporter:
     def export_to_onnx(
         self,
         output_path: str,
-        opset_version: int = 14
+        seq_length: int = 20,
+        opset_version: int = 17,
+        dynamic_shapes: bool = True
     ):
         """
         Export model to ONNX format.
         
+        The LSTM state is an explicit input/output (h0, c0 -> hn, cn) so the
+        keyboard can feed one token at a time; batch and sequence length
+        are dynamic unless dynamic_shapes is False.
+        
         Args:
             output_path: Path to save ONNX model
-            batch_size: Batch size for export
-            seq_length: Sequence length
+            seq_length: Sequence length of the dummy input
+            opset_version: ONNX opset version
+            dynamic_shapes: Dynamic batch/sequence axes (False: fixed to
+                batch 1 and seq_length)
+        """
+        self.model.eval()
+        
+        print(f"\nExporting to ONNX (opset {opset_version})...")
+        
+        # Initialize a dummy input for ONNX export (only its shape matters)
+        dummy_x = torch.zeros((1, seq_length), dtype=torch.long)
+        state_shape = (self.model.num_layers, 1, self.model.hidden_dim)
+        h0 = torch.zeros(state_shape)
+        c0 = torch.zeros(state_shape)
+        
+        export_kwargs = {}
+        if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+            # The TorchScript-based exporter emits a single ONNX LSTM op,
+            # which ONNX Runtime can quantize to int8
+            export_kwargs['dynamo'] = False
+        
+        torch.onnx.export(
+            self.model,
+            (dummy_x, (h0, c0)),
+            output_path,
+            opset_version=opset_version,
+            input_names=['x', 'h0', 'c0'],
+            output_names=['logits', 'hn', 'cn'],
+            dynamic_axes={
+                'x': {0: 'batch', 1: 'seq'},
+                'h0': {1: 'batch'},
+                'c0': {1: 'batch'},
+                'logits': {0: 'batch', 1: 'seq'},
+                'hn': {1: 'batch'},
+                'cn': {1: 'batch'},
+            } if dynamic_shapes else None,
+            **export_kwargs
+        )
+        
+        print(f"✓ Model exported to: {output_path}")
+        self._verify_onnx_model(output_path)
+    
+    def export_to_onnx_static(
+        self,
+        output_path: str,
+        seq_length: int = 32,
+        opset_version: int = 17
+    ):
+        """
+        Export a fixed-shape (batch 1, seq_length) ONNX model with ONNX
+        Runtime's graph optimizations applied offline.
+        
+        With static shapes ONNX Runtime can constant-fold the shape
+        arithmetic; the optimized graph is saved so the app doesn't redo
+        this on every session start. Extended (not all) optimizations keep
+        the file portable across CPUs.
+        
+        Args:
+            output_path: Path to save the optimized ONNX model
+            seq_length: Fixed sequence length (the keyboard pads to it)
             opset_version: ONNX opset version
         """
-        # Initialize a dummy input for ONNX export
+        output_path = Path(output_path)
+        raw_path = output_path.with_name(output_path.stem + '.raw.onnx')
+        self.export_to_onnx(str(raw_path), seq_length, opset_version, dynamic_shapes=False)
+        
+        print("Optimizing static ONNX graph...")
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        session_options.optimized_model_filepath = str(output_path)
+        ort.InferenceSession(str(raw_path), session_options, providers=['CPUExecutionProvider'])
+        raw_path.unlink()
+        
+        print(f"✓ Optimized model saved to: {output_path}")
+        self._verify_onnx_model(str(output_path))
+    
     def export_to_torchscript(self, output_path: str):
-        """Export model to TorchScript format (more stable than ONNX)"""
+        """
+        Export model to TorchScript format (more stable than ONNX).
+        
+        The model is scripted rather than traced so any sequence length
+        works, then frozen (weights inlined as constants) and optimized for
+        inference (op fusion). forward_last is kept alongside forward.
+        """
         self.model.eval()
         
         print(f"Exporting model to TorchScript...")
-        print(f"  Input shape: {self.dummy_input.shape}")
         
-        # Trace the model
-        traced_model = torch.jit.trace(self.model, self.dummy_input)
+        # Script, freeze and optimize the model
+        scripted_model = torch.jit.script(self.model)
+        scripted_model = torch.jit.freeze(scripted_model, preserved_attrs=['forward_last'])
+        scripted_model = torch.jit.optimize_for_inference(scripted_model, other_methods=['forward_last'])
         
-        # Save traced model
-        traced_model.save(output_path)
+        # Save scripted model
+        scripted_model.save(output_path)
         
         print(f"✓ Model exported to: {output_path}")
         
@@ -68,6 +154,68 @@ class ModelExporter:
         
         return output_path
     
+    def export_quantized_lite(
+        self,
+        output_path: str,
+        backend: str = 'qnnpack',
+        min_top1_agreement: float = 0.9,
+        num_check_batches: int = 8
+    ):
+        """
+        Export a dynamically quantized (int8) model for the PyTorch Lite interpreter.
+        
+        Args:
+            output_path: Path to save the .ptl model
+            backend: Quantized engine the model will run on
+            min_top1_agreement: Fraction of positions where the int8 model's
+                top prediction must match FP32; below it nothing is saved
+            num_check_batches: Random (8, 50) batches the agreement is measured on
+        """
+        print(f"Exporting int8 model for the lite interpreter ({backend})...")
+        
+        quantized_model = self.model.quantize(backend)
+        
+        # Check the int8 model against FP32 before saving (seeded, so the
+        # gate gives the same answer on every run)
+        generator = torch.Generator().manual_seed(0)
+        max_diff = 0.0
+        matches = 0
+        positions = 0
+        with torch.no_grad():
+            for _ in range(num_check_batches):
+                inputs = torch.randint(0, self.vocab_size, (8, 50), generator=generator)
+                reference = self.model(inputs)[0]
+                output = quantized_model(inputs)[0]
+                max_diff = max(max_diff, (output - reference).abs().max().item())
+                matches += (output.argmax(-1) == reference.argmax(-1)).sum().item()
+                positions += reference.shape[0] * reference.shape[1]
+        top1_match = matches / positions
+        print(f"  int8 vs FP32: max logit diff {max_diff:.4f}, top-1 agreement {top1_match:.1%}")
+        if top1_match < min_top1_agreement:
+            raise RuntimeError(
+                f"int8 model agrees with FP32 on {top1_match:.1%} of top-1 predictions "
+                f"(minimum {min_top1_agreement:.0%}); not saving {output_path}"
+            )
+        
+        # Script rather than trace so the sequence length stays dynamic
+        scripted_model = torch.jit.script(quantized_model)
+        
+        try:
+            from torch.utils.mobile_optimizer import optimize_for_mobile
+            scripted_model = optimize_for_mobile(scripted_model)
+        except RuntimeError as e:
+            # Needs a PyTorch build with XNNPACK
+            print(f"  Skipping mobile optimization: {e}")
+        
+        scripted_model._save_for_lite_interpreter(output_path)
+        
+        print(f"✓ Model exported to: {output_path}")
+        
+        size_mb = Path(output_path).stat().st_size / (1024 ** 2)
+        print(f"  Size: {size_mb:.2f} MB")
+        
+        return output_path
+    
     def _verify_onnx_model(self, onnx_path: str):
         """Verify exported ONNX model"""
         print("\nVerifying ONNX model...")
@@ -104,10 +252,11 @@ class ModelExporter:
             # Determine quantization type
             quant_type = QuantType.QInt8 if quantization_mode == "int8" else QuantType.QUInt8
             
-            # Quantize
+            # Quantize (LSTM included: ONNX Runtime has int8 LSTM kernels)
             quantize_dynamic(
                 input_path,
                 output_path,
+                op_types_to_quantize=['MatMul', 'Gemm', 'LSTM'],
                 weight_type=quant_type
             )
             
@@ -135,15 +284,30 @@ class ModelExporter:
         """
         print(f"\nTesting ONNX inference...")
         
-        # Create inference session
-        session = ort.InferenceSession(onnx_path)
+        # Session configured like on device: all graph optimizations, one
+        # intra-op thread, sequential execution, mobile accelerators if any
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session_options.intra_op_num_threads = 1
+        session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        available = ort.get_available_providers()
+        providers = [
+            provider for provider in ('CoreMLExecutionProvider', 'NnapiExecutionProvider')
+            if provider in available
+        ] + ['CPUExecutionProvider']
+        session = ort.InferenceSession(onnx_path, sess_options=session_options, providers=providers)
         
         # Get input/output names
-        input_name = session.get_inputs()[0].name
+        inputs = session.get_inputs()
         output_name = session.get_outputs()[0].name
         
-        # Run inference
-        result = session.run([output_name], {input_name: test_input})
+        # Run inference (LSTM state inputs start at zero)
+        feed = {inputs[0].name: test_input}
+        for state in inputs[1:]:
+            shape = list(state.shape)  # (num_layers, batch, hidden_dim)
+            shape[1] = test_input.shape[0]
+            feed[state.name] = np.zeros(shape, dtype=np.float32)
+        result = session.run([output_name], feed)
         
         print(f"✓ Inference successful")
         print(f"  Input shape: {test_input.shape}")
@@ -154,7 +318,8 @@ class ModelExporter:
 
 def export_model_for_mobile(
     model_path: str = "models/best_model.pt",
-    output_dir: str = "models/mobile"
+    output_dir: str = "models/mobile",
+    model_config: Optional[Dict] = None
 ):
     """
     Export trained model for mobile deployment.
@@ -162,13 +327,14 @@ def export_model_for_mobile(
     Args:
         model_path: Path to trained PyTorch model
         output_dir: Output directory for exported models
+        model_config: Model hyperparameters (defaults to the model config file)
     """
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     
     # Load model config
-    config = get_model_config()
-    model_config = config['model']
+    if model_config is None:
+        model_config = get_model_config()['model']
     
     # Load checkpoint
     print(f"Loading model from: {model_path}")
@@ -190,19 +356,46 @@ def export_model_for_mobile(
     torchscript_path = output_path / "tiny_lstm.pt"
     exporter.export_to_torchscript(str(torchscript_path))
     
-    # Test inference
+    # int8 model for on-device CPU inference
+    lite_path = output_path / "tiny_lstm.ptl"
+    try:
+        exporter.export_quantized_lite(str(lite_path))
+    except RuntimeError as e:
+        print(f"⚠️  Skipping quantized lite model: {e}")
+        lite_path = None
+    
+    # ONNX Runtime (Mobile): fp32 graph plus int8 dynamic-quantized copy
+    onnx_path = output_path / "tiny_lstm.onnx"
+    onnx_int8_path = output_path / "tiny_lstm.int8.onnx"
+    exporter.export_to_onnx(str(onnx_path))
+    exporter.quantize_onnx(str(onnx_path), str(onnx_int8_path))
+    
+    # Test input shared by the parity check and the TorchScript test
     test_input = torch.randint(
         0, model_config['vocab_size'],
         (1, 10),
         dtype=torch.long
     )
     
+    # ONNX parity check against the PyTorch model
+    onnx_logits = exporter.test_onnx_inference(str(onnx_path), test_input.numpy())
+    with torch.no_grad():
+        torch_logits = model(test_input)[0].numpy()
+    max_diff = float(np.abs(onnx_logits - torch_logits).max())
+    print(f"  ONNX vs PyTorch: max logit diff {max_diff:.6f}")
+    if max_diff > 1e-3:
+        print("⚠️  ONNX output does not match the PyTorch model")
+    
+    # Fixed-shape variant for the common batch-1 keyboard call
+    onnx_static_path = output_path / "tiny_lstm_static_opt.onnx"
+    exporter.export_to_onnx_static(str(onnx_static_path))
+    
     print(f"\nTesting TorchScript model:")
-    traced_model = torch.jit.load(str(torchscript_path))
-    traced_model.eval()
+    scripted_model = torch.jit.load(str(torchscript_path))
+    scripted_model.eval()
     
     with torch.no_grad():
-        output = traced_model(test_input)
+        output = scripted_model(test_input)
     
     print(f"✓ Inference successful")
     print(f"  Input shape: {test_input.shape}")
@@ -212,6 +405,10 @@ def export_model_for_mobile(
     print("Export Summary:")
     print("=" * 80)
     print(f"TorchScript model: {torchscript_path}")
+    print(f"Quantized lite model: {lite_path or 'not exported'}")
+    print(f"ONNX model: {onnx_path}")
+    print(f"ONNX int8 model: {onnx_int8_path}")
+    print(f"ONNX static model: {onnx_static_path}")
     print(f"\nThis model can be converted to:")
     print(f"  - iOS: Core ML (use coremltools)")
     print(f"  - Android: TFLite (use onnx-tf)")